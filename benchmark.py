@@ -0,0 +1,242 @@
+"""Micro-benchmarks for the hot routes, driven through Flask's test client.
+
+    python benchmark.py                       # all routes at 10, 1k and 100k waiting
+    python benchmark.py --sizes 10 1000 --requests 500 --output before.json
+    python benchmark.py --store sqlite
+    python benchmark.py --recovery 100000     # event-log replay time instead
+    python benchmark.py --startup 10          # cold-start time in fresh interpreters
+
+Reports throughput, p50/p99 latency and tracemalloc peak allocation per
+request. The JSON output can be diffed between commits.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import main
+from eventlog import EventLog
+from storage import DEFAULT_QUEUE_ID, MemoryStore, SQLiteStore
+
+DEFAULT_SIZES = (10, 1000, 100000)
+
+
+def add_one(store, _client):
+    store.add_ticket()
+
+
+# Each join as a new visitor: a returning session gets its ticket back
+def new_visitor(_store, client):
+    client.delete_cookie(client.application.config['SESSION_COOKIE_NAME'])
+
+
+# (name, method, path builder, untimed setup before each request)
+SCENARIOS = (
+    ('join', 'GET', lambda _size: '/join', new_visitor),
+    ('status', 'GET', lambda _size: '/status', None),
+    ('user_status', 'GET', lambda size: f'/status/{max(1, size // 2)}', None),
+    ('admin', 'GET', lambda _size: '/admin', None),
+    ('admin_next', 'POST', lambda _size: '/admin/next', add_one),
+)
+
+
+def make_store(kind, directory):
+    if kind == 'sqlite':
+        return SQLiteStore(os.path.join(directory, f'bench-{time.monotonic_ns()}.db'))
+    return MemoryStore()
+
+
+def fill_queue(store, size):
+    store.set_active(True, 'Benchmark', 'bench')
+    for _ in range(size):
+        store.add_ticket()
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_scenario(client, store, scenario, size, requests):
+    name, method, build_path, setup = scenario
+    path = build_path(size)
+    send = client.post if method == 'POST' else client.get
+
+    # Warm caches and the template environment outside the measurements
+    send(path)
+
+    latencies = []
+    for _ in range(requests):
+        if setup:
+            setup(store, client)
+        started = time.perf_counter()
+        response = send(path)
+        latencies.append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {path} returned {response.status_code}")
+
+    # Allocation pass, separate so tracing overhead does not skew timings
+    alloc_requests = max(1, min(requests, 50))
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(alloc_requests):
+            if setup:
+                setup(store, client)
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            send(path)
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+
+    total = sum(latencies)
+    return {
+        'route': name,
+        'method': method,
+        'path': path,
+        'queue_size': size,
+        'requests': requests,
+        'throughput_rps': round(requests / total, 1) if total else None,
+        'mean_ms': round(statistics.mean(latencies) * 1000, 3),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'peak_alloc_kib': round(statistics.mean(peaks) / 1024, 1),
+        'response_bytes': len(response.data),
+    }
+
+
+# Time to rebuild a MemoryStore from its event log after `events`
+# mutations: with the default snapshot interval and with none at all
+def run_recovery(events):
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for label, snapshot_every in (('snapshots', None), ('log_only', events + 1)):
+            kwargs = {'snapshot_every': snapshot_every} if snapshot_every else {}
+            store = MemoryStore(EventLog(directory, label, **kwargs))
+            store.set_active(True, 'Benchmark', 'bench', ['Counter 1', 'Counter 2'])
+            while store.get_version() < events:
+                store.add_ticket()
+                if store.get_version() % 3 == 0:
+                    store.serve_next('Counter 1' if store.get_version() % 2 else 'Counter 2')
+            store.close()
+            started = time.perf_counter()
+            recovered = MemoryStore(EventLog(directory, label))
+            elapsed = time.perf_counter() - started
+            recovered.close()
+            results.append({'mode': label, 'events': events, 'recovery_ms': round(elapsed * 1000, 1)})
+            print(f"recovery     {label:<9} n={events:<7} {elapsed * 1000:>9.1f} ms", file=sys.stderr)
+    return results
+
+
+# Run in a fresh interpreter per sample; prints milliseconds per phase
+STARTUP_PROBE = '''
+import json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+app = main.create_app()
+created = time.perf_counter()
+client = app.test_client()
+client.get('/')
+first = time.perf_counter()
+client.get('/qr/join.png')
+qr = time.perf_counter()
+print(json.dumps({'import_ms': (imported - started) * 1000, 'create_app_ms': (created - imported) * 1000,
+                  'first_request_ms': (first - created) * 1000, 'first_qr_ms': (qr - first) * 1000}))
+'''
+
+
+# Median cold-start phases over `samples` fresh interpreters: importing
+# main, building the app, the first page and the first QR code
+def run_startup(samples):
+    directory = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, WARMUP='0')
+    runs = []
+    for _ in range(samples):
+        output = subprocess.run([sys.executable, '-c', STARTUP_PROBE], capture_output=True, text=True,
+                                cwd=directory, env=env, check=True).stdout
+        runs.append(json.loads(output.splitlines()[-1]))
+    result = {'samples': samples}
+    for phase in runs[0]:
+        result[phase] = round(statistics.median(run[phase] for run in runs), 1)
+        print(f"startup      {phase:<17} {result[phase]:>9.1f} ms", file=sys.stderr)
+    return [result]
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes, requests, store_kind, routes):
+    results = []
+    # Every request comes from one address; measure the route, not the limiter
+    main.JOIN_RATE_PER_MINUTE = 0
+    client = main.create_app().test_client()
+    scenarios = [s for s in SCENARIOS if not routes or s[0] in routes]
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            for scenario in scenarios:
+                store = make_store(store_kind, directory)
+                main.queues.put(DEFAULT_QUEUE_ID, store)
+                fill_queue(store, size)
+                result = run_scenario(client, store, scenario, size, requests)
+                results.append(result)
+                print(f"{result['route']:<12} n={size:<7} {result['throughput_rps']:>9} req/s  "
+                      f"p50 {result['p50_ms']:>9.3f} ms  p99 {result['p99_ms']:>9.3f} ms  "
+                      f"{result['peak_alloc_kib']:>9.1f} KiB/req", file=sys.stderr)
+    return {
+        'revision': git_revision(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'store': store_kind,
+        'results': results,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES))
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--store', choices=('memory', 'sqlite'), default='memory')
+    parser.add_argument('--routes', nargs='+', choices=[s[0] for s in SCENARIOS])
+    parser.add_argument('--recovery', type=int, metavar='EVENTS',
+                        help='measure event-log recovery after this many mutations instead')
+    parser.add_argument('--startup', type=int, metavar='SAMPLES',
+                        help='measure cold-start time over this many fresh interpreters instead')
+    parser.add_argument('--output', help='write JSON results to this file instead of stdout')
+    return parser.parse_args(argv)
+
+
+def cli(argv=None):
+    args = parse_args(argv)
+    if args.recovery:
+        report = {'revision': git_revision(), 'results': run_recovery(args.recovery)}
+    elif args.startup:
+        report = {'revision': git_revision(), 'results': run_startup(args.startup)}
+    else:
+        report = run(args.sizes, args.requests, args.store, args.routes)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    cli()
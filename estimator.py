@@ -0,0 +1,69 @@
+import os
+from collections import deque
+
+DEFAULT_MINUTES = float(os.environ.get('WAIT_DEFAULT_MINUTES', 5))
+WINDOW = int(os.environ.get('WAIT_WINDOW', 50))
+ALPHA = float(os.environ.get('WAIT_ALPHA', 0.2))
+MIN_SAMPLES = 3
+# An interval longer than this many rolling medians (one slow customer, a
+# counter left open) moves the EWMA only as far as that bound
+OUTLIER_FACTOR = float(os.environ.get('WAIT_OUTLIER_FACTOR', 3))
+# Gaps longer than this (breaks, quiet spells) are not service times
+MAX_INTERVAL = float(os.environ.get('WAIT_MAX_INTERVAL_MINUTES', 30)) * 60
+
+
+# Streaming estimate of minutes per customer from the intervals between
+# serves. The last WINDOW intervals are kept in a fixed-size ring buffer;
+# their rolling median caps outliers before they reach the EWMA.
+class ServiceRateEstimator:
+    def __init__(self, default_minutes=DEFAULT_MINUTES, window=WINDOW, alpha=ALPHA):
+        self.default_minutes = default_minutes
+        self.alpha = alpha
+        self.intervals = deque(maxlen=window)
+        self.ewma = None
+        self.last_served_at = None
+
+    @classmethod
+    def from_timestamps(cls, timestamps, **kwargs):
+        estimator = cls(**kwargs)
+        for served_at in timestamps:
+            estimator.record(served_at)
+        return estimator
+
+    def reset(self):
+        self.intervals.clear()
+        self.ewma = None
+        self.last_served_at = None
+
+    def record(self, served_at):
+        last_served_at = self.last_served_at
+        self.last_served_at = served_at
+        if last_served_at is None:
+            return
+        interval = served_at - last_served_at
+        if interval <= 0 or interval > MAX_INTERVAL:
+            return
+        sample = interval
+        if len(self.intervals) >= MIN_SAMPLES:
+            sample = min(interval, OUTLIER_FACTOR * self.median())
+        self.intervals.append(interval)
+        if self.ewma is None:
+            self.ewma = sample
+        else:
+            self.ewma += self.alpha * (sample - self.ewma)
+
+    def median(self):
+        if not self.intervals:
+            return None
+        ordered = sorted(self.intervals)
+        middle = len(ordered) // 2
+        if len(ordered) % 2:
+            return ordered[middle]
+        return (ordered[middle - 1] + ordered[middle]) / 2
+
+    # Intervals are measured between serves at any counter, so they already
+    # reflect the combined rate; only the default is split across counters
+    def minutes_per_customer(self, counters=1):
+        if len(self.intervals) < MIN_SAMPLES:
+            return self.default_minutes / max(1, counters)
+        return self.ewma / 60
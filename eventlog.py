@@ -0,0 +1,185 @@
+import json
+import os
+import threading
+import time
+
+FSYNC_INTERVAL = float(os.environ.get('QUEUE_LOG_FSYNC_INTERVAL', 0.05))
+SNAPSHOT_EVERY = int(os.environ.get('QUEUE_LOG_SNAPSHOT_EVERY', 10000))
+
+
+def _fsync_directory(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+# Write-ahead log for one in-memory queue: `<name>.log` holds one JSON
+# event per line, `<name>.snapshot` the live state at some version and
+# `<name>.tickets.db` the finished tickets (a TicketLedger the store keeps
+# here). Appends reach the OS before the mutation is applied; a background
+# thread fsyncs at most every FSYNC_INTERVAL seconds, so a burst of
+# joins shares one fsync. A snapshot starts a new log and drops the old
+# one once it is written, so recovery only replays the events after it.
+class EventLog:
+    def __init__(self, directory, name, fsync_interval=FSYNC_INTERVAL, snapshot_every=SNAPSHOT_EVERY):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.log_path = os.path.join(directory, f'{name}.log')
+        self.old_log_path = os.path.join(directory, f'{name}.log.old')
+        self.snapshot_path = os.path.join(directory, f'{name}.snapshot')
+        self.ledger_path = os.path.join(directory, f'{name}.tickets.db')
+        self.fsync_interval = fsync_interval
+        self.snapshot_every = snapshot_every
+        self.since_snapshot = 0
+        self._file = None
+        self._dirty = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._flusher = None
+        self._snapshotter = None
+        # Set from starting a snapshot until the old log is dropped; a
+        # snapshot that failed leaves it set and the log just keeps growing
+        self._rotated = False
+
+    # Returns the last snapshot (or None) and the events logged after it.
+    # A torn line left by a crash mid-write is cut off.
+    def load(self):
+        snapshot = None
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'rb') as f:
+                snapshot = json.load(f)
+        events = self._read(self.old_log_path) + self._read(self.log_path)
+        base = snapshot['version'] if snapshot else 0
+        # Events already covered by the snapshot (crash before the old log
+        # was dropped)
+        events = [event for event in events if event[1] > base]
+        if os.path.exists(self.old_log_path):
+            # A snapshot was cut short: fold both logs back into one so the
+            # next snapshot cannot rotate over events it does not cover
+            tmp_path = self.log_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.writelines(json.dumps(event, separators=(',', ':')) + '\n' for event in events)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.log_path)
+            os.remove(self.old_log_path)
+            _fsync_directory(self.directory)
+        self.since_snapshot = len(events)
+        return snapshot, events
+
+    @staticmethod
+    def _read(path):
+        if not os.path.exists(path):
+            return []
+        events = []
+        with open(path, encoding='utf-8', errors='replace') as f:
+            lines = f.read().split('\n')
+        lines.pop()
+        try:
+            # One parse for the whole log is several times faster than
+            # a json.loads per line
+            events = json.loads('[' + ','.join(lines) + ']')
+        except ValueError:
+            for line in lines:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    break
+        valid = sum(len(line.encode('utf-8')) + 1 for line in lines[:len(events)])
+        if valid < os.path.getsize(path):
+            os.truncate(path, valid)
+        return events
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.log_path, 'a', encoding='utf-8')  # noqa: SIM115 (held until close)
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name='eventlog-fsync', daemon=True)
+                self._flusher.start()
+        return self._file
+
+    # True once enough events have accumulated for a new snapshot
+    def append(self, event):
+        line = json.dumps(event, separators=(',', ':')) + '\n'
+        with self._cond:
+            f = self._open()
+            f.write(line)
+            f.flush()
+            self._dirty = True
+            self._cond.notify()
+        self.since_snapshot += 1
+        return self.since_snapshot >= self.snapshot_every and not self._rotated
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while not self._dirty and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+            time.sleep(self.fsync_interval)
+            self.sync()
+
+    def sync(self):
+        with self._cond:
+            if self._file is None or not self._dirty:
+                return
+            self._dirty = False
+            # fsync a duplicate so appends are not blocked behind the disk
+            fd = os.dup(self._file.fileno())
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    # Callers hold the store lock, so no event lands between the state
+    # being captured and the new log being started. Serialising and
+    # fsyncing happen on a background thread, after `before` (which makes
+    # anything else the state refers to durable).
+    def write_snapshot(self, state, before=None):
+        with self._cond:
+            old = self._file
+            if old is not None:
+                os.replace(self.log_path, self.old_log_path)
+            self._file = open(self.log_path, 'w', encoding='utf-8')  # noqa: SIM115 (held until close)
+            self._dirty = False
+            self._rotated = True
+        self.since_snapshot = 0
+        self._snapshotter = threading.Thread(target=self._write_snapshot, args=(state, old, before),
+                                             name='eventlog-snapshot', daemon=True)
+        self._snapshotter.start()
+
+    def _write_snapshot(self, state, old, before):
+        if old is not None:
+            os.fsync(old.fileno())
+            old.close()
+        if before is not None:
+            before()
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        _fsync_directory(self.directory)
+        if old is not None:
+            os.remove(self.old_log_path)
+        self._rotated = False
+
+    def close(self):
+        if self._snapshotter is not None:
+            self._snapshotter.join()
+        self.sync()
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,237 @@
+import contextlib
+import os
+import re
+import sqlite3
+import tempfile
+from collections import OrderedDict
+
+HISTORY_DIR = os.environ.get('HISTORY_DIR') or os.path.join(tempfile.gettempdir(), 'quickqueue-history')
+# Most recently served numbers kept in memory to answer was_served; only
+# older ones are looked up in the file
+HISTORY_WINDOW = int(os.environ.get('HISTORY_WINDOW', 1000))
+
+# Spill files are named after the process that owns them
+SPILL_PATTERN = re.compile(r'(?:tickets|served)-(?:(\d+)-)?.*\.db')
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+# Spill files left behind by workers that were killed before they could
+# remove them (and unowned ones from older versions)
+def remove_stale_spills(directory=HISTORY_DIR):
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    for name in names:
+        match = SPILL_PATTERN.fullmatch(name)
+        if match is None or (match.group(1) and process_alive(int(match.group(1)))):
+            continue
+        with contextlib.suppress(OSError):
+            os.remove(os.path.join(directory, name))
+
+
+EXPORT_FIELDS = ('queue_number', 'status', 'counter', 'joined_at', 'called_at', 'served_at', 'removed_at')
+
+
+# Per-ticket lifecycle timestamps for one in-memory session. Tickets still
+# waiting or being served live in `active`; finished ones (served,
+# skipped or removed) are appended in batches to an on-disk SQLite file, so memory is
+# bounded by the live queue rather than the length of the session. The
+# file also answers whether a ticket was served, for numbers older than
+# the last `window` served ones kept in memory.
+#
+# Given a `path` the file is kept there across restarts instead of being a
+# temporary spill: an event-logged store snapshots only how many rows it
+# had and truncates back to that on recovery.
+# Callers serialise access (MemoryStore holds its lock).
+class TicketLedger:
+    def __init__(self, directory=HISTORY_DIR, batch_size=256, path=None, window=HISTORY_WINDOW):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.path = path
+        self.window = window
+        self.recent = OrderedDict()
+        # Highest served number no longer in `recent`
+        self.evicted = 0
+        self.active = {}
+        self.pending = []
+        self.finished = 0
+        self.served = 0
+        self._db = None
+        self._path = None
+
+    def join(self, number, joined_at):
+        self.active[number] = [joined_at, None, None]
+
+    def call(self, number, counter, called_at):
+        record = self.active.get(number)
+        if record is not None:
+            record[1] = called_at
+            record[2] = counter
+
+    def finish(self, number, status, finished_at):
+        joined_at, called_at, counter = self.active.pop(number, (None, None, None))
+        self.append((number, status, counter, joined_at, called_at,
+                     finished_at if status == 'served' else None,
+                     finished_at if status != 'served' else None))
+
+    def append(self, row):
+        self.extend((row,))
+
+    def extend(self, rows):
+        count = len(self.pending)
+        self.pending.extend(tuple(row) for row in rows)
+        self.finished += len(self.pending) - count
+        for row in self.pending[count:]:
+            if row[1] == 'served':
+                self.served += 1
+                self.recent[row[0]] = None
+        while len(self.recent) > self.window:
+            self.evicted = max(self.evicted, self.recent.popitem(last=False)[0])
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        db = self._open()
+        with db:
+            db.executemany(f'INSERT INTO tickets VALUES ({", ".join("?" * len(EXPORT_FIELDS))})', self.pending)
+        self.pending = []
+
+    def _open(self):
+        if self._db is None:
+            if self.path is None:
+                os.makedirs(self.directory, exist_ok=True)
+                fd, path = tempfile.mkstemp(prefix=f'tickets-{os.getpid()}-', suffix='.db', dir=self.directory)
+                os.close(fd)
+                db = sqlite3.connect(path, check_same_thread=False)
+                db.execute('PRAGMA journal_mode=OFF')
+                db.execute('PRAGMA synchronous=OFF')
+            else:
+                path = self.path
+                db = sqlite3.connect(path, check_same_thread=False)
+                # Commits never wait for the disk; sync() checkpoints
+                db.execute('PRAGMA journal_mode=WAL')
+                db.execute('PRAGMA synchronous=NORMAL')
+                db.execute('PRAGMA wal_autocheckpoint=0')
+            db.execute(f'CREATE TABLE IF NOT EXISTS tickets ({", ".join(EXPORT_FIELDS)})')
+            db.execute('CREATE INDEX IF NOT EXISTS idx_tickets_number ON tickets (queue_number)')
+            self._db = db
+            self._path = path
+        return self._db
+
+    # Makes the rows flushed so far durable. Uses its own connection, so it
+    # can run off the caller's lock (the snapshot thread calls it).
+    def sync(self):
+        if self.path is None or not os.path.exists(self.path):
+            return
+        try:
+            fd = os.open(self.path + '-wal', os.O_RDONLY)
+        except FileNotFoundError:
+            pass
+        else:
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        db = sqlite3.connect(self.path)
+        try:
+            db.execute('PRAGMA synchronous=FULL')
+            db.execute('PRAGMA wal_checkpoint(PASSIVE)')
+        finally:
+            db.close()
+
+    # Drops the finished rows after the first `count`, e.g. back to what a
+    # snapshot recorded before its logged events are replayed
+    def truncate(self, count):
+        self.pending = []
+        self.recent.clear()
+        if self._db is None and self.path is None:
+            self.finished = self.served = self.evicted = 0
+            return
+        db = self._open()
+        with db:
+            db.execute('DELETE FROM tickets WHERE rowid > ?', (count,))
+        self.finished, self.served, self.evicted = db.execute(
+            "SELECT COUNT(*), COUNT(CASE WHEN status = 'served' THEN 1 END), "
+            "COALESCE(MAX(CASE WHEN status = 'served' THEN queue_number END), 0) FROM tickets"
+        ).fetchone()
+
+    def was_served(self, number):
+        if number in self.recent:
+            return True
+        if number > self.evicted:
+            return False
+        if any(row[0] == number and row[1] == 'served' for row in self.pending):
+            return True
+        if self._db is None:
+            return False
+        row = self._db.execute(
+            "SELECT 1 FROM tickets WHERE queue_number = ? AND status = 'served' LIMIT 1", (number,)
+        ).fetchone()
+        return row is not None
+
+    # The last `limit` serve times, oldest first
+    def served_times(self, limit):
+        self.flush()
+        if self._db is None:
+            return []
+        rows = self._db.execute(
+            "SELECT served_at FROM tickets WHERE status = 'served' ORDER BY rowid DESC LIMIT ?", (limit,)
+        ).fetchall()
+        return [row[0] for row in reversed(rows)]
+
+    def active_rows(self):
+        for number, (joined_at, called_at, counter) in sorted(self.active.items()):
+            status = 'serving' if called_at else 'waiting'
+            yield number, status, counter, joined_at, called_at, None, None
+
+    # Captures the session as it is now and returns a generator that reads
+    # it without the caller's lock: finished rows through a separate
+    # connection (bounded by rowid), then the live tickets
+    def reader(self):
+        self.flush()
+        count = self.finished
+        # Queried now so the rows survive being cleared mid-export
+        db = sqlite3.connect(self._path) if self._path is not None and count else None
+        cursor = db.execute('SELECT * FROM tickets WHERE rowid <= ? ORDER BY rowid', (count,)) if db else None
+        active = list(self.active_rows())
+
+        def rows():
+            if db is not None:
+                try:
+                    while True:
+                        batch = cursor.fetchmany(500)
+                        if not batch:
+                            break
+                        yield from batch
+                finally:
+                    db.close()
+            yield from active
+
+        return rows()
+
+    def clear(self):
+        if self.path is None:
+            self.close()
+        self.truncate(0)
+        self.active = {}
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+        if self._path is not None and self.path is None:
+            with contextlib.suppress(OSError):
+                os.remove(self._path)
+            self._path = None
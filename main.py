@@ -1,614 +1,1006 @@
-from flask import Flask, render_template_string, request, redirect, url_for, session
-import qrcode
-from qrcode.constants import ERROR_CORRECT_L
+import cProfile
+import csv
+import gzip
+import hashlib
 import io
-import base64
+import json
+import math
 import os
-from datetime import datetime, date
-
-app = Flask(__name__)
-app.secret_key = os.environ.get('SECRET_KEY', 'quickqueue-pro-secure-key-2024')
-
-# In-memory storage
-queue_data = {
-    'is_active': False,
-    'business_name': 'Business Name',
-    'created_by': 'Manager',
-    'session_started': None,
-    'queue': [],
-    'serving_number': 0,
-    'served_numbers': []
-}
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from functools import wraps
+
+import click
+from flask import (
+    Blueprint,
+    Flask,
+    Response,
+    abort,
+    before_render_template,
+    current_app,
+    g,
+    has_request_context,
+    jsonify,
+    make_response,
+    redirect,
+    render_template,
+    request,
+    session,
+    stream_with_context,
+    template_rendered,
+    url_for,
+)
+from flask.cli import with_appcontext
+from werkzeug.local import LocalProxy
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from history import EXPORT_FIELDS, remove_stale_spills
+from metrics import Registry, timed
+from printing import ticket_pdf
+from ratelimit import TokenBucketLimiter
+from storage import (
+    APPOINTMENT_LANE,
+    DEFAULT_LANE,
+    DEFAULT_QUEUE_ID,
+    LANES,
+    QUEUE_ID_PATTERN,
+    MemoryStore,
+    QueueRegistry,
+)
+
+SECRET_KEY = os.environ.get('SECRET_KEY', 'quickqueue-pro-secure-key-2024')
+
+# Number of reverse proxies in front of the app (1 on Render), so client
+# addresses and external URLs come from their X-Forwarded-* headers
+TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 0))
+
+# WARMUP=1 loads the QR/imaging stack, compiles the templates and renders
+# the default queue's QR codes in the background once the app is created,
+# so the first visitors after a cold start do not pay for it. The QR codes
+# need the public URL, which Render provides as RENDER_EXTERNAL_URL.
+WARMUP = os.environ.get('WARMUP', '0') == '1'
+PUBLIC_URL = os.environ.get('PUBLIC_URL') or os.environ.get('RENDER_EXTERNAL_URL')
+
+# Queue storage: in memory by default, or shared SQLite when QUEUE_DB is set.
+# Every queue hosted by this process has its own store; `store` resolves to
+# the one selected by the current request (/q/<queue_id>/...), or the default.
+queues = QueueRegistry()
+
+def get_store():
+    if has_request_context() and 'store' in g:
+        return g.store
+    return queues.get(DEFAULT_QUEUE_ID)
+
+store = LocalProxy(get_store)
+
+# Rendered QR codes, keyed by (url, fill_color, back_color), least recently used first
+QR_CACHE_SIZE = int(os.environ.get('QR_CACHE_SIZE', 256))
+qr_cache = OrderedDict()
+qr_cache_lock = threading.Lock()
+qr_cache_stats = {'hits': 0, 'misses': 0}
+QR_MAX_AGE = int(os.environ.get('QR_MAX_AGE', 86400))
+# QR code kind -> page it links to
+QR_KINDS = {'join': '.join_queue', 'status': '.queue_status'}
+
+# Live pages follow a Server-Sent Events stream, or without EventSource poll
+# a JSON endpoint with the version they last saw, so most polls are an empty
+# 304. Streams are served by gevent workers (render.yaml), so an idle one
+# holds a greenlet rather than a thread. The public board lists only the
+# next STATUS_BOARD_SIZE tickets; the rest are just counted.
+SSE_POLL_INTERVAL = float(os.environ.get('SSE_POLL_INTERVAL', 2))
+SSE_KEEPALIVE = float(os.environ.get('SSE_KEEPALIVE', 15))
+SSE_MAX_DURATION = float(os.environ.get('SSE_MAX_DURATION', 300))
+SSE_RETRY_MS = 3000
+STATUS_BOARD_SIZE = int(os.environ.get('STATUS_BOARD_SIZE', 50))
+
+# New tickets per client address: JOIN_BURST at once, refilled at
+# JOIN_RATE_PER_MINUTE. Generous, since a waiting room often shares one
+# public address; reloads by the same browser reuse their ticket instead.
+JOIN_RATE_PER_MINUTE = float(os.environ.get('JOIN_RATE_PER_MINUTE', 30))
+JOIN_BURST = int(os.environ.get('JOIN_BURST', 20))
+join_limiter = TokenBucketLimiter(JOIN_RATE_PER_MINUTE / 60, JOIN_BURST,
+                                  int(os.environ.get('JOIN_LIMITER_CLIENTS', 10000)))
+# Tickets remembered in the session cookie, one per queue
+SESSION_TICKETS_MAX = 10
+
+# Admin dashboard: the waiting list is shown a page at a time
+ADMIN_PAGE_SIZE = int(os.environ.get('ADMIN_PAGE_SIZE', 50))
+# Most tickets one bulk add/remove/serve may touch
+ADMIN_BULK_LIMIT = int(os.environ.get('ADMIN_BULK_LIMIT', 1000))
+# Most paper tickets one print run may reserve
+PRINT_LIMIT = int(os.environ.get('PRINT_LIMIT', 5000))
+
+# Session export: rows are written in batches of EXPORT_BATCH per chunk
+EXPORT_FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+EXPORT_BATCH = 500
+
+# Metrics, exposed in Prometheus text format on /metrics (per worker process)
+metrics = Registry()
+request_duration = metrics.histogram('quickqueue_request_duration_seconds',
+                                     'Time spent handling a request', ('endpoint', 'method'))
+helper_duration = metrics.histogram('quickqueue_helper_duration_seconds',
+                                    'Time spent in hot helper functions', ('helper',))
+tickets_joined = metrics.counter('quickqueue_tickets_joined_total', 'Tickets issued', ('source',))
+tickets_served = metrics.counter('quickqueue_tickets_served_total', 'Serve Next actions')
+tickets_removed = metrics.counter('quickqueue_tickets_removed_total', 'Tickets removed by staff')
+joins_reused = metrics.counter('quickqueue_joins_reused_total', 'Joins answered with the ticket the session already holds')
+joins_limited = metrics.counter('quickqueue_joins_rate_limited_total', 'Joins refused by the rate limiter')
+metrics.gauge('quickqueue_queue_depth', 'Customers currently waiting',
+              lambda: store.get_waiting_page(0, 0)[1] if is_queue_active() else 0)
+metrics.gauge('quickqueue_state_version', 'Queue state version', lambda: store.get_version())
+metrics.gauge('quickqueue_qr_cache_size', 'Rendered QR codes held in the cache', lambda: len(qr_cache))
+metrics.gauge('quickqueue_queues_loaded', 'Queues currently loaded in this process', lambda: len(queues))
+
+# Opt-in cProfile dumps for slow requests: PROFILE_REQUESTS=all profiles every
+# request, PROFILE_REQUESTS=header only those sent with "X-Profile: 1"
+PROFILE_REQUESTS = os.environ.get('PROFILE_REQUESTS', 'off')
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', 100))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'quickqueue-profiles'))
 
 # Helper functions
 def is_queue_active():
-    return queue_data['is_active']
-
-def set_queue_active(active, business_name="Business Name", created_by="Manager"):
-    queue_data['is_active'] = active
-    queue_data['business_name'] = business_name
-    queue_data['created_by'] = created_by
-    if active:
-        queue_data['session_started'] = datetime.now()
-        queue_data['queue'] = []
-        queue_data['serving_number'] = 0
-        queue_data['served_numbers'] = []
+    return store.is_active()
+
+def set_queue_active(active, business_name="Business Name", created_by="Manager", counters=None,
+                     prerender=False):
+    store.set_active(active, business_name, created_by, counters)
+    if active and prerender:
+        prerender_qr_codes()
 
 def get_business_info():
-    return (queue_data['business_name'], 
-            queue_data['created_by'], 
-            queue_data['session_started'] or datetime.now())
+    business_name, created_by, session_started = store.get_business_info()
+    return business_name, created_by, session_started or datetime.now()
 
+@timed(helper_duration, ('get_queue_data',))
 def get_queue_data():
-    current_number = queue_data['serving_number']
-    waiting = [num for num in queue_data['queue'] if num > current_number]
-    total_waiting = len(waiting)
-    return current_number, waiting, total_waiting
+    return store.get_queue_data()
+
+def notify_queue_changed():
+    store.notify_changed()
+
+def build_status_snapshot():
+    if not is_queue_active():
+        return {'active': False}
+    counters, waiting, total_waiting = get_queue_data()
+    return {
+        'active': True,
+        'now_serving': get_now_serving(counters),
+        'counters': counters,
+        'waiting': list(waiting[:STATUS_BOARD_SIZE]),
+        'total_waiting': total_waiting,
+        'wait_time': calculate_wait_time(total_waiting - 1)
+    }
+
+def get_status_snapshot():
+    return store.cached('status_snapshot', build_status_snapshot)
+
+# A waiting appointment whose slot has not come yet is 'scheduled': it has
+# no place in line until then
+def get_ticket_status(queue_number):
+    status = store.get_ticket_status(queue_number)
+    if status == 'waiting':
+        lane, slot = store.get_ticket_lane(queue_number)
+        if slot is not None and slot > time.time():
+            return 'scheduled'
+    return status
+
+def get_ticket_snapshot(queue_number):
+    if not is_queue_active():
+        return {'active': False}
+    status = get_ticket_status(queue_number)
+    position = store.get_position(queue_number) if status == 'waiting' else 0
+    return {
+        'active': True,
+        'queue_number': queue_number,
+        'status': status,
+        'slot': store.get_ticket_lane(queue_number)[1] if status == 'scheduled' else None,
+        'counter': store.get_ticket_counter(queue_number) if status == 'serving' else None,
+        'position': position,
+        'wait_time': calculate_ticket_wait(queue_number, position) if status in ('waiting', 'scheduled') else 0,
+        'now_serving': get_now_serving(store.get_counters())
+    }
+
+# Sends an event when the version changes and the payload differs from the
+# last one sent. A reconnecting EventSource sends the last event id (a page
+# opening a stream passes ?version=), so unchanged state is not sent again.
+def stream_changes(build_payload):
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('version')
+    
+    def generate():
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        started = last_sent = time.monotonic()
+        version = payload = None
+        while time.monotonic() - started < SSE_MAX_DURATION:
+            current_version = store.get_version()
+            if current_version != version:
+                version = current_version
+                etag = state_etag(version)
+                new_payload = build_payload() if etag != last_id else payload
+                if new_payload != payload:
+                    payload = new_payload
+                    last_sent = time.monotonic()
+                    yield f"id: {etag}\ndata: {json.dumps(dict(payload, version=etag))}\n\n"
+            elif time.monotonic() - last_sent >= SSE_KEEPALIVE:
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+            store.wait_for_change(version, SSE_POLL_INTERVAL)
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def version_response(build_payload):
+    # Pollers send back the version they last saw (?version= or If-None-Match)
+    # and get an empty 304 without the payload being built. The version is
+    # the opaque ETag value, so a restarted store (new epoch) never matches.
+    etag = state_etag()
+    if request.args.get('version') == etag or request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(dict(build_payload(), version=etag))
+    response.set_etag(etag, weak=True)
+    response.cache_control.no_cache = True
+    return response
+
+# Weak, since the same state may be sent gzip- or brotli-encoded
+def state_etag(version=None):
+    if version is None:
+        version = store.get_version()
+    return f"{store.get_epoch()}-{version}-{current_app.config['SITE_FINGERPRINT']}"
+
+# Pages that depend only on the URL and the queue state: a client that
+# sends back the current ETag gets a 304 before the view runs. The version
+# is read before rendering, so a page can only be newer than its ETag.
+def conditional_on_state(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        etag = state_etag()
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag, weak=True)
+        response.cache_control.no_cache = True
+        return response
+    return wrapper
+
+def get_current_status():
+    snapshot = get_status_snapshot()
+    if not snapshot['active']:
+        return {'active': False}
+    return {
+        'active': True,
+        'current_number': snapshot['now_serving'],
+        'queue_length': snapshot['total_waiting'],
+        'average_wait_time': snapshot['wait_time']
+    }
 
-def calculate_wait_time(position):
-    return max(0, (position - 1) * 5)
+# Headline number for single-number displays: the newest ticket called
+def get_now_serving(counters):
+    return max(counters.values(), default=0)
+
+# Counters pull from one queue, so tickets leave it at the combined rate.
+# An idle counter takes the next ticket at once; otherwise it waits for
+# the next counter to free up.
+def calculate_wait_time(waiting_ahead):
+    slots = waiting_ahead if store.has_idle_counter() else waiting_ahead + 1
+    return max(0, round(slots * store.get_minutes_per_customer()))
+
+# For a waiting ticket at `position` (0 while scheduled): appointments are
+# not called before their slot
+def calculate_ticket_wait(queue_number, position):
+    wait_time = calculate_wait_time(position - 1)
+    lane, slot = store.get_ticket_lane(queue_number)
+    if slot is not None:
+        wait_time = max(wait_time, math.ceil((slot - time.time()) / 60))
+    return wait_time
+
+LANE_LABELS = {'vip': 'VIP', 'priority': 'Priority', 'standard': 'Walk-in', APPOINTMENT_LANE: 'Appointment'}
+
+def describe_lane(lane, slot):
+    if slot is not None:
+        return f"Appointment at {datetime.fromtimestamp(slot):%H:%M}"
+    if lane in (None, DEFAULT_LANE):
+        return None
+    return f"{LANE_LABELS.get(lane, lane)} lane"
+
+def parse_counters(value):
+    return [name for name in (part.strip() for part in value.split(',')) if name]
+
+# A session ticket is only valid for the queue session it was issued in
+def session_ticket_marker():
+    business_name, created_by, session_started = get_business_info()
+    return f"{store.get_epoch()}:{session_started.isoformat()}"
+
+def get_session_ticket():
+    entry = session.get('tickets', {}).get(g.get('queue_id', DEFAULT_QUEUE_ID))
+    if not entry or entry[0] != session_ticket_marker():
+        return None
+    queue_number = entry[1]
+    if store.get_ticket_status(queue_number) not in ('waiting', 'serving'):
+        return None
+    return queue_number
+
+def remember_session_ticket(queue_number):
+    tickets = dict(session.get('tickets', {}))
+    queue_id = g.get('queue_id', DEFAULT_QUEUE_ID)
+    tickets.pop(queue_id, None)
+    tickets[queue_id] = [session_ticket_marker(), queue_number]
+    while len(tickets) > SESSION_TICKETS_MAX:
+        tickets.pop(next(iter(tickets)))
+    session['tickets'] = tickets
+
+def get_admin_page():
+    return max(1, request.values.get('page', 1, type=int))
+
+def build_admin_snapshot(page):
+    if not is_queue_active():
+        return {'active': False}
+    waiting, total_waiting = store.get_waiting_page((page - 1) * ADMIN_PAGE_SIZE, ADMIN_PAGE_SIZE)
+    total_customers, served_today = store.get_totals()
+    return {
+        'active': True,
+        'counters': store.get_counters(),
+        'waiting': waiting,
+        'total_waiting': total_waiting,
+        'total_customers': total_customers,
+        'served_today': served_today,
+        'page': page,
+        'pages': max(1, -(-total_waiting // ADMIN_PAGE_SIZE))
+    }
 
-def generate_qr_code(url):
+# Pages past the end show the last one, so they share its cache entry
+def get_admin_snapshot(page):
+    page = min(page, max(1, -(-store.get_waiting_page(0, 0)[1] // ADMIN_PAGE_SIZE)))
+    return store.cached(('admin_snapshot', page), lambda: build_admin_snapshot(page))
+
+# Dashboard scripts post with Accept: application/json and get the new
+# state back; plain form posts still redirect
+def admin_action_response(**result):
+    page = get_admin_page()
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(dict(get_admin_snapshot(page), version=state_etag(), **result))
+    return redirect(url_for('.admin_panel', page=page))
+
+# Lane and appointment time ("HH:MM", the nearest such time: more than 12
+# hours ago means tomorrow) from the admin add form
+def get_lane_choice():
+    lane = request.form.get('lane') or DEFAULT_LANE
+    if lane not in LANE_LABELS:
+        abort(400)
+    if lane != APPOINTMENT_LANE:
+        return lane, None
+    try:
+        slot_time = datetime.strptime(request.form.get('slot', ''), '%H:%M').time()
+    except ValueError:
+        abort(400)
+    slot = datetime.combine(date.today(), slot_time)
+    if slot < datetime.now() - timedelta(hours=12):
+        slot += timedelta(days=1)
+    return lane, slot.timestamp()
+
+def get_bulk_count():
+    count = request.form.get('count', 1, type=int)
+    if not 1 <= count <= ADMIN_BULK_LIMIT:
+        abort(400)
+    return count
+
+# "5, 8, 10-20" -> [5, 8, 10, 11, ..., 20]
+def parse_ticket_numbers(value):
+    numbers = set()
+    for part in value.replace(' ', '').split(','):
+        if not part:
+            continue
+        start, dash, end = part.partition('-')
+        if not start.isdecimal() or (dash and not end.isdecimal()):
+            abort(400)
+        start = int(start)
+        end = int(end) if end else start
+        if start < 1 or end < start or len(numbers) + end - start + 1 > ADMIN_BULK_LIMIT:
+            abort(400)
+        numbers.update(range(start, end + 1))
+    return sorted(numbers)
+
+def format_timestamp(value):
+    return datetime.fromtimestamp(value).isoformat(sep=' ', timespec='milliseconds') if value else None
+
+def export_rows():
+    for number, status, counter, *timestamps in store.iter_tickets():
+        yield [number, status, counter, *(format_timestamp(value) for value in timestamps)]
+
+def stream_export(fmt):
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if fmt == 'csv':
+            writer.writerow(EXPORT_FIELDS)
+        for count, row in enumerate(export_rows(), 1):
+            if fmt == 'csv':
+                writer.writerow(row)
+            else:
+                buffer.write(json.dumps(dict(zip(EXPORT_FIELDS, row, strict=True))) + '\n')
+            if count % EXPORT_BATCH == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    
+    business_name, created_by, session_started = get_business_info()
+    queue_id = g.get('queue_id', DEFAULT_QUEUE_ID)
+    filename = f"queue-{queue_id}-{session_started:%Y%m%d-%H%M}.{fmt}"
+    response = Response(stream_with_context(generate()), mimetype=EXPORT_FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# qrcode, and Pillow through it, is imported on first use to keep it off
+# the cold-start path
+@timed(helper_duration, ('render_qr_code',))
+def render_qr_code(url, fill_color="#2c3e50", back_color="white"):
+    import qrcode
+    from qrcode.constants import ERROR_CORRECT_L
+    
     qr = qrcode.QRCode(version=1, error_correction=ERROR_CORRECT_L, box_size=10, border=4)
     qr.add_data(url)
     qr.make(fit=True)
-    img = qr.make_image(fill_color="#2c3e50", back_color="white")
+    img = qr.make_image(fill_color=fill_color, back_color=back_color)
     buffer = io.BytesIO()
     img.save(buffer, "PNG")
-    buffer.seek(0)
-    img_str = base64.b64encode(buffer.getvalue()).decode()
-    return f"data:image/png;base64,{img_str}"
-
-# HTML Template
-BASE_STYLE = '''
-<style>
-    * { margin: 0; padding: 0; box-sizing: border-box; }
-    body { 
-        font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; 
-        background: #f8fafc; 
-        color: #2d3748; 
-        line-height: 1.6;
-    }
-    .container { max-width: 1200px; margin: 0 auto; padding: 20px; }
-    .header { 
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        color: white; 
-        padding: 3rem 2rem; 
-        border-radius: 12px;
-        margin-bottom: 2rem;
-        text-align: center;
-    }
-    .card {
-        background: white;
-        padding: 2rem;
-        border-radius: 12px;
-        box-shadow: 0 1px 3px rgba(0, 0, 0, 0.1);
-        border: 1px solid #e2e8f0;
-        margin-bottom: 1.5rem;
-    }
-    .btn {
-        display: inline-flex;
-        align-items: center;
-        gap: 8px;
-        padding: 12px 24px;
-        background: #667eea;
-        color: white;
-        text-decoration: none;
-        border-radius: 8px;
-        font-weight: 500;
-        border: none;
-        cursor: pointer;
-        transition: all 0.2s ease;
-    }
-    .btn:hover { background: #5a67d8; transform: translateY(-1px); }
-    .btn-primary { background: #48bb78; }
-    .btn-primary:hover { background: #38a169; }
-    .btn-secondary { background: #718096; }
-    .btn-secondary:hover { background: #4a5568; }
-    .btn-danger { background: #e53e3e; }
-    .btn-danger:hover { background: #c53030; }
-    .qr-container { text-align: center; padding: 1.5rem; background: #f7fafc; border-radius: 8px; margin: 1.5rem 0; }
-    .qr-code { max-width: 200px; margin: 0 auto; }
-    .queue-number { font-size: 4rem; font-weight: 700; color: #48bb78; margin: 1rem 0; }
-    .form-group { margin-bottom: 1.5rem; }
-    .form-label { display: block; margin-bottom: 0.5rem; font-weight: 500; color: #4a5568; }
-    .form-input { width: 100%; padding: 12px 16px; border: 2px solid #e2e8f0; border-radius: 8px; font-size: 16px; }
-    .form-input:focus { outline: none; border-color: #667eea; }
-    .grid { display: grid; gap: 1.5rem; margin: 2rem 0; }
-    .grid-2 { grid-template-columns: repeat(auto-fit, minmax(300px, 1fr)); }
-    .grid-3 { grid-template-columns: repeat(auto-fit, minmax(250px, 1fr)); }
-    .stat-card { text-align: center; padding: 1.5rem; background: white; border-radius: 8px; box-shadow: 0 1px 3px rgba(0, 0, 0, 0.1); }
-    .stat-number { font-size: 2.5rem; font-weight: 700; color: #667eea; margin-bottom: 0.5rem; }
-    .footer { text-align: center; margin-top: 3rem; padding: 2rem; color: #718096; border-top: 1px solid #e2e8f0; }
-</style>
-'''
-
-# Routes
-@app.route('/')
+    return buffer.getvalue()
+
+@timed(helper_duration, ('get_qr_png',))
+def get_qr_png(url, fill_color="#2c3e50", back_color="white"):
+    key = (url, fill_color, back_color)
+    with qr_cache_lock:
+        cached = qr_cache.get(key)
+        if cached is not None:
+            qr_cache.move_to_end(key)
+            qr_cache_stats['hits'] += 1
+            return cached
+        qr_cache_stats['misses'] += 1
+    
+    png = render_qr_code(url, fill_color, back_color)
+    entry = (png, hashlib.sha1(png).hexdigest())
+    with qr_cache_lock:
+        qr_cache[key] = entry
+        qr_cache.move_to_end(key)
+        while len(qr_cache) > QR_CACHE_SIZE:
+            qr_cache.popitem(last=False)
+    return entry
+
+def qr_response(url):
+    png, etag = get_qr_png(url)
+    response = Response(png, mimetype='image/png')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = QR_MAX_AGE
+    return response.make_conditional(request)
+
+def qr_target_url(kind):
+    return url_for(QR_KINDS[kind], _external=True)
+
+def prerender_qr_codes():
+    for kind in QR_KINDS:
+        get_qr_png(qr_target_url(kind))
+
+def get_qr_cache_stats():
+    with qr_cache_lock:
+        return dict(qr_cache_stats, size=len(qr_cache), max_size=QR_CACHE_SIZE)
+
+# Static assets are linked with a content hash so browsers can cache them for a year
+ASSET_MAX_AGE = 365 * 24 * 3600
+asset_hashes = {}
+
+def asset_url(filename):
+    digest = asset_hashes.get(filename)
+    if digest is None:
+        with open(os.path.join(current_app.static_folder, filename), 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()[:12]
+        asset_hashes[filename] = digest
+    return url_for('static', filename=filename, v=digest)
+
+def cache_fingerprinted_assets(response):
+    if request.endpoint == 'static' and 'v' in request.args and response.status_code == 200:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = ASSET_MAX_AGE
+        response.cache_control.immutable = True
+    return response
+
+# Templates and static files change on deploy while the queue state (and
+# so its version) may not; this goes into page ETags
+def site_fingerprint(app):
+    digest = hashlib.sha1()
+    for folder in (os.path.join(app.root_path, app.template_folder), app.static_folder):
+        for dirpath, dirnames, filenames in os.walk(folder):
+            dirnames.sort()
+            for name in sorted(filenames):
+                with open(os.path.join(dirpath, name), 'rb') as f:
+                    digest.update(f.read())
+    return digest.hexdigest()[:8]
+
+# Compression negotiated from Accept-Encoding: brotli when the optional
+# module is installed, otherwise gzip. Streams (SSE, exports, PDFs) are left alone.
+COMPRESS_MIN_SIZE = 500
+COMPRESS_TYPES = {'text/html', 'text/css', 'text/plain', 'text/javascript',
+                  'application/javascript', 'application/json'}
+
+def choose_encoding():
+    if brotli is not None and request.accept_encodings['br']:
+        return 'br'
+    if request.accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+# Pages shared by every viewer of a state are rendered and compressed once
+# per version (see QueueStore.cached): the body in each encoding
+def build_page(html):
+    body = html.encode('utf-8')
+    page = {None: body}
+    if len(body) >= COMPRESS_MIN_SIZE:
+        for encoding in ('br', 'gzip') if brotli is not None else ('gzip',):
+            page[encoding] = compress(body, encoding)
+    return page
+
+def page_response(page):
+    encoding = choose_encoding()
+    if encoding not in page:
+        encoding = None
+    response = Response(page[encoding], mimetype='text/html')
+    response.vary.add('Accept-Encoding')
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+def compress_response(response):
+    if response.status_code != 200 or response.mimetype not in COMPRESS_TYPES:
+        return response
+    if 'Content-Encoding' in response.headers:
+        return response
+    if response.is_streamed and request.endpoint != 'static':
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding()
+    if encoding is None:
+        return response
+    response.direct_passthrough = False
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+def should_profile():
+    if PROFILE_REQUESTS == 'all':
+        return True
+    return PROFILE_REQUESTS == 'header' and request.headers.get('X-Profile') == '1'
+
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if should_profile():
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    request_duration.observe(elapsed, (request.endpoint or 'unmatched', request.method))
+    
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        if elapsed * 1000 >= PROFILE_SLOW_MS:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            path = os.path.join(PROFILE_DIR, f"{request.endpoint or 'unmatched'}-{time.time_ns()}.prof")
+            profiler.dump_stats(path)
+            current_app.logger.warning("Slow request %s %s took %.1f ms, profile written to %s",
+                               request.method, request.path, elapsed * 1000, path)
+    return response
+
+def start_template_timer(*_args, **_extra):
+    g.template_started = time.perf_counter()
+
+def record_template_time(*_args, **_extra):
+    started = g.pop('template_started', None)
+    if started is not None:
+        helper_duration.observe(time.perf_counter() - started, ('render_template',))
+
+# Routes for one queue, registered at / for the default queue and again
+# under /q/<queue_id>/ for every other hosted queue
+queue_pages = Blueprint('queue', __name__)
+
+@queue_pages.url_value_preprocessor
+def select_queue(endpoint, values):
+    queue_id = (values or {}).pop('queue_id', None)
+    if queue_id is None:
+        g.store = queues.get(DEFAULT_QUEUE_ID)
+        return
+    if not QUEUE_ID_PATTERN.fullmatch(queue_id):
+        abort(404)
+    g.queue_id = queue_id
+    store = queues.get(queue_id, create=endpoint == 'tenant.start_queue')
+    if store is None:
+        # A queue only comes into being when staff start it; until then its
+        # admin pages see an idle, unsaved one and everything else is a 404
+        if not request.url_rule.rule.startswith('/q/<queue_id>/admin'):
+            abort(404)
+        store = MemoryStore()
+    g.store = store
+
+@queue_pages.url_defaults
+def add_queue_id(endpoint, values):
+    if 'queue_id' in g and current_app.url_map.is_endpoint_expecting(endpoint, 'queue_id'):
+        values.setdefault('queue_id', g.queue_id)
+
+@queue_pages.route('/')
+@conditional_on_state
 def home():
     if not is_queue_active():
-        return f'''
-        <!DOCTYPE html>
-        <html>
-        <head><title>Queue System</title>{BASE_STYLE}</head>
-        <body>
-            <div class="container">
-                <div style="max-width: 500px; margin: 100px auto; text-align: center;">
-                    <div class="card">
-                        <div style="font-size: 4rem; margin-bottom: 1rem;">⏸️</div>
-                        <h1 style="margin-bottom: 1rem;">Queue System Inactive</h1>
-                        <p style="color: #718096; margin-bottom: 2rem;">The queue management system is currently not active.</p>
-                        <a href="/admin/init" class="btn">Activate Queue System</a>
-                    </div>
-                </div>
-            </div>
-        </body>
-        </html>
-        '''
+        return render_template('inactive.html')
     
     business_name, created_by, session_started = get_business_info()
-    join_url = f"{request.url_root}join"
-    qr_code = generate_qr_code(join_url)
-    
-    return f'''
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>{business_name} - Queue Management</title>
-        {BASE_STYLE}
-    </head>
-    <body>
-        <div class="container">
-            <div class="header">
-                <h1 style="font-size: 2.5rem; margin-bottom: 0.5rem;">🚀 {business_name}</h1>
-                <p style="font-size: 1.2rem; opacity: 0.9;">Digital Queue Management System</p>
-            </div>
-
-            <div class="qr-container">
-                <h3 style="margin-bottom: 1rem;">Scan to Join Queue</h3>
-                <div class="qr-code">
-                    <img src="{qr_code}" alt="Join Queue QR Code" style="width: 100%; border-radius: 8px;">
-                </div>
-                <p style="margin-top: 1rem; color: #718096;">Scan QR code or use the button below</p>
-            </div>
-
-            <div class="grid grid-2">
-                <div class="card" style="text-align: center;">
-                    <div style="font-size: 3rem; margin-bottom: 1rem;">👥</div>
-                    <h3 style="margin-bottom: 1rem;">Join Queue</h3>
-                    <p style="color: #718096; margin-bottom: 1.5rem;">Get your digital queue number</p>
-                    <a href="/join" class="btn btn-primary">Get Queue Number</a>
-                </div>
-                
-                <div class="card" style="text-align: center;">
-                    <div style="font-size: 3rem; margin-bottom: 1rem;">📊</div>
-                    <h3 style="margin-bottom: 1rem;">Queue Status</h3>
-                    <p style="color: #718096; margin-bottom: 1.5rem;">View current queue progress</p>
-                    <a href="/status" class="btn">View Live Status</a>
-                </div>
-            </div>
-
-            <div class="footer">
-                <p>QuickQueue Professional &copy; 2024</p>
-            </div>
-        </div>
-    </body>
-    </html>
-    '''
-
-@app.route('/join')
+    qr_code = url_for('.qr_image', kind='join')
+    return render_template('index.html', business_name=business_name, qr_code=qr_code)
+
+@queue_pages.route('/join')
 def join_queue():
     if not is_queue_active():
-        return redirect('/')
+        return redirect(url_for('.home'))
     
-    if queue_data['queue']:
-        next_number = max(queue_data['queue']) + 1
+    next_number = get_session_ticket()
+    if next_number is not None:
+        joins_reused.inc()
+        if store.get_ticket_status(next_number) == 'serving':
+            return redirect(url_for('.user_queue_status', queue_number=next_number))
+    elif request.method == 'HEAD':
+        # Link checkers and previewers: nothing to show, so issue nothing
+        return Response(status=200)
     else:
-        next_number = 1
-    
-    queue_data['queue'].append(next_number)
-    position = len([num for num in queue_data['queue'] if num < next_number]) + 1
-    wait_time = calculate_wait_time(position)
+        retry_after = join_limiter.acquire(request.remote_addr) if JOIN_RATE_PER_MINUTE > 0 else 0
+        if retry_after:
+            joins_limited.inc()
+            response = make_response(render_template(
+                'error.html', title='Too Many Requests',
+                message='Too many tickets were requested from this network. Please try again shortly.'
+            ), 429)
+            response.headers['Retry-After'] = str(int(retry_after) + 1)
+            return response
+        next_number = store.add_ticket()
+        notify_queue_changed()
+        tickets_joined.inc(labels=('join',))
+        remember_session_ticket(next_number)
+    position = store.get_position(next_number)
+    wait_time = calculate_wait_time(position - 1)
     business_name, created_by, session_started = get_business_info()
     
-    status_url = f"{request.url_root}status/{next_number}"
-    qr_code = generate_qr_code(status_url)
-    
-    return f'''
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Your Queue Number</title>
-        {BASE_STYLE}
-    </head>
-    <body>
-        <div class="container">
-            <div style="max-width: 600px; margin: 2rem auto;">
-                <div class="card">
-                    <div style="text-align: center;">
-                        <div style="font-size: 4rem; color: #48bb78; margin-bottom: 1rem;">✅</div>
-                        <h1 style="margin-bottom: 1rem;">You're in the Queue</h1>
-                        <p style="color: #718096; margin-bottom: 2rem;">Your digital queue number has been assigned</p>
-                        
-                        <div class="queue-number">#{next_number}</div>
-                        
-                        <div class="card" style="background: #f0fff4; border-color: #9ae6b4;">
-                            <h3 style="margin-bottom: 1rem; color: #2f855a;">Queue Information</h3>
-                            <p><strong>Position in line:</strong> {position}</p>
-                            <p><strong>Estimated wait time:</strong> {wait_time} minutes</p>
-                            <p><strong>Business:</strong> {business_name}</p>
-                        </div>
-
-                        <div class="qr-container">
-                            <h4 style="margin-bottom: 1rem;">Track Your Status</h4>
-                            <div class="qr-code">
-                                <img src="{qr_code}" alt="Status QR Code" style="width: 100%; border-radius: 8px;">
-                            </div>
-                            <p style="margin-top: 1rem; color: #718096;">Scan to track your real-time queue position</p>
-                        </div>
-
-                        <div style="display: flex; gap: 1rem; justify-content: center; flex-wrap: wrap; margin-top: 2rem;">
-                            <a href="/status/{next_number}" class="btn">Track My Status</a>
-                            <a href="/status" class="btn btn-secondary">View Full Queue</a>
-                            <a href="/" class="btn btn-secondary">Return Home</a>
-                        </div>
-                    </div>
-                </div>
-            </div>
-        </div>
-    </body>
-    </html>
-    '''
-
-@app.route('/status')
+    qr_code = url_for('.ticket_qr_image', queue_number=next_number)
+    return render_template('success.html', queue_number=next_number, position=position,
+                           wait_time=wait_time, business_name=business_name, qr_code=qr_code)
+
+@queue_pages.route('/status')
+@conditional_on_state
 def queue_status():
     if not is_queue_active():
-        return redirect('/')
+        return redirect(url_for('.home'))
     
-    current_number, waiting, total_waiting = get_queue_data()
-    wait_time = calculate_wait_time(total_waiting + 1)
+    return page_response(store.cached(('status_page', request.script_root), build_status_page))
+
+def build_status_page():
+    counters, waiting, total_waiting = get_queue_data()
+    wait_time = calculate_wait_time(total_waiting - 1)
     business_name, created_by, session_started = get_business_info()
-    
-    return f'''
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Queue Status</title>
-        {BASE_STYLE}
-        <meta http-equiv="refresh" content="15">
-    </head>
-    <body>
-        <div class="container">
-            <div class="header">
-                <h1>📊 Live Queue Status</h1>
-                <p>{business_name}</p>
-            </div>
-
-            <div class="grid grid-3">
-                <div class="stat-card">
-                    <div class="stat-number">{current_number if current_number else '--'}</div>
-                    <div>Now Serving</div>
-                </div>
-                <div class="stat-card">
-                    <div class="stat-number">{len(waiting)}</div>
-                    <div>Waiting</div>
-                </div>
-                <div class="stat-card">
-                    <div class="stat-number">{wait_time}</div>
-                    <div>Est. Wait (min)</div>
-                </div>
-            </div>
-
-            <div class="card">
-                <h3 style="margin-bottom: 1rem;">Currently Waiting</h3>
-                <div style="min-height: 100px;">
-                    {' '.join([f'<span style="display: inline-block; background: white; padding: 8px 16px; margin: 0.5rem; border-radius: 20px; border: 1px solid #e2e8f0;">#{num}</span>' for num in waiting]) if waiting else '<p style="color: #718096; text-align: center;">No customers waiting</p>'}
-                </div>
-            </div>
-
-            <div style="text-align: center; margin-top: 2rem;">
-                <a href="/join" class="btn btn-primary">Join Queue</a>
-                <a href="/" class="btn btn-secondary">Return Home</a>
-            </div>
-        </div>
-    </body>
-    </html>
-    '''
-
-@app.route('/status/<int:queue_number>')
+    return build_page(render_template('status.html', current_number=get_now_serving(counters),
+                                      counters=counters, waiting=waiting[:STATUS_BOARD_SIZE],
+                                      total_waiting=total_waiting, wait_time=wait_time,
+                                      business_name=business_name))
+
+@queue_pages.route('/status/stream')
+def queue_status_stream():
+    return stream_changes(get_status_snapshot)
+
+@queue_pages.route('/status/live')
+def queue_status_live():
+    return version_response(get_status_snapshot)
+
+@queue_pages.route('/current_status')
+def current_status():
+    return version_response(get_current_status)
+
+@queue_pages.route('/current_status/<int:queue_number>')
+def current_ticket_status(queue_number):
+    return version_response(lambda: get_ticket_snapshot(queue_number))
+
+@queue_pages.route('/status/<int:queue_number>/stream')
+def user_queue_status_stream(queue_number):
+    return stream_changes(lambda: get_ticket_snapshot(queue_number))
+
+@queue_pages.route('/status/<int:queue_number>')
+@conditional_on_state
 def user_queue_status(queue_number):
     if not is_queue_active():
-        return redirect('/')
+        return redirect(url_for('.home'))
     
-    current_number, waiting, total_waiting = get_queue_data()
+    current_number = get_now_serving(store.get_counters())
+    status = get_ticket_status(queue_number)
+    counter = None
     
-    if queue_number not in queue_data['queue'] and queue_number not in queue_data['served_numbers']:
-        return f'''
-        <!DOCTYPE html>
-        <html>
-        <head><title>Error</title>{BASE_STYLE}</head>
-        <body>
-            <div class="container">
-                <div style="max-width: 500px; margin: 100px auto; text-align: center;">
-                    <div class="card">
-                        <div style="font-size: 4rem; color: #e53e3e; margin-bottom: 1rem;">❌</div>
-                        <h1 style="margin-bottom: 1rem;">Queue Number Not Found</h1>
-                        <p style="color: #718096; margin-bottom: 2rem;">Please verify your queue number.</p>
-                        <a href="/join" class="btn btn-primary">Get Queue Number</a>
-                    </div>
-                </div>
-            </div>
-        </body>
-        </html>
-        '''
+    if status is None:
+        return render_template('error.html', title='Queue Number Not Found',
+                               message='Please verify your queue number.')
     
-    if queue_number in queue_data['served_numbers']:
-        status = 'served'
+    if status == 'served':
         user_position = 0
         status_icon = '✅'
         status_color = '#48bb78'
         status_message = 'Service Completed'
-    elif queue_number == current_number:
-        status = 'serving'
+    elif status == 'serving':
         user_position = 0
+        counter = store.get_ticket_counter(queue_number)
         status_icon = '🎉'
         status_color = '#ed8936'
-        status_message = 'Your Turn Now'
+        status_message = f'Your Turn Now at {counter}' if counter else 'Your Turn Now'
+    elif status == 'scheduled':
+        user_position = 0
+        status_icon = '📅'
+        status_color = '#805ad5'
+        status_message = 'Scheduled'
     else:
-        status = 'waiting'
-        user_position = len([num for num in queue_data['queue'] if num < queue_number]) + 1
+        user_position = store.get_position(queue_number)
         status_icon = '⏳'
         status_color = '#4299e1'
         status_message = 'In Queue'
     
-    wait_time = calculate_wait_time(user_position) if user_position > 0 else 0
+    wait_time = calculate_ticket_wait(queue_number, user_position) if status in ('waiting', 'scheduled') else 0
+    lane, slot = store.get_ticket_lane(queue_number)
+    lane_label = describe_lane(lane, slot)
     business_name, created_by, session_started = get_business_info()
-    
-    return f'''
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Your Status</title>
-        {BASE_STYLE}
-        <meta http-equiv="refresh" content="30">
-    </head>
-    <body>
-        <div class="container">
-            <div style="max-width: 600px; margin: 2rem auto;">
-                <div class="card">
-                    <div style="text-align: center;">
-                        <div style="font-size: 4rem; margin-bottom: 1rem;">{status_icon}</div>
-                        <h1 style="margin-bottom: 0.5rem;">Queue Status</h1>
-                        <p style="color: #718096; margin-bottom: 2rem;">{business_name}</p>
-                        
-                        <div class="queue-number">#{queue_number}</div>
-                        
-                        <div style="background: {status_color}; color: white; padding: 1.5rem; border-radius: 8px; margin: 1.5rem 0;">
-                            <h2 style="margin-bottom: 0.5rem;">{status_message}</h2>
-                            {f'<p style="font-size: 1.2rem;">Position {user_position} in line</p>' if status == 'waiting' else ''}
-                        </div>
-
-                        <div class="grid grid-2" style="margin: 2rem 0;">
-                            <div class="stat-card">
-                                <div class="stat-number">{current_number if current_number else '--'}</div>
-                                <div>Now Serving</div>
-                            </div>
-                            <div class="stat-card">
-                                <div class="stat-number">{wait_time if status == 'waiting' else 0}</div>
-                                <div>Est. Wait (min)</div>
-                            </div>
-                        </div>
-
-                        <div style="display: flex; gap: 1rem; justify-content: center; flex-wrap: wrap;">
-                            <a href="/status" class="btn">View Full Queue</a>
-                            <a href="/" class="btn btn-secondary">Return Home</a>
-                        </div>
-                    </div>
-                </div>
-            </div>
-        </div>
-    </body>
-    </html>
-    '''
-
-@app.route('/admin/init')
+    return render_template('user_status.html', queue_number=queue_number, status=status,
+                           counter=counter, user_position=user_position, status_icon=status_icon,
+                           status_color=status_color, status_message=status_message,
+                           current_number=current_number, wait_time=wait_time, lane_label=lane_label,
+                           slot=slot if status == 'scheduled' else None, business_name=business_name)
+
+@queue_pages.route('/qr/<kind>.png')
+def qr_image(kind):
+    if kind not in QR_KINDS:
+        abort(404)
+    return qr_response(qr_target_url(kind))
+
+@queue_pages.route('/qr/status/<int:queue_number>.png')
+def ticket_qr_image(queue_number):
+    return qr_response(url_for('.user_queue_status', queue_number=queue_number, _external=True))
+
+@queue_pages.route('/admin/init')
 def admin_init():
-    return f'''
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Activate Queue System</title>
-        {BASE_STYLE}
-    </head>
-    <body>
-        <div class="container">
-            <div style="max-width: 500px; margin: 50px auto;">
-                <div class="card">
-                    <div style="text-align: center; margin-bottom: 2rem;">
-                        <div style="font-size: 3rem; color: #667eea; margin-bottom: 1rem;">🚀</div>
-                        <h1 style="margin-bottom: 0.5rem;">Activate Queue System</h1>
-                        <p style="color: #718096;">Configure your digital queue management</p>
-                    </div>
-                    
-                    <form action="/admin/start" method="POST">
-                        <div class="form-group">
-                            <label class="form-label">Business/Organization Name</label>
-                            <input type="text" name="business_name" class="form-input" placeholder="Enter business name" required>
-                        </div>
-                        
-                        <div class="form-group">
-                            <label class="form-label">Manager/Administrator Name</label>
-                            <input type="text" name="created_by" class="form-input" placeholder="Enter administrator name" required>
-                        </div>
-                        
-                        <button type="submit" class="btn" style="width: 100%;">🚀 Activate Queue System</button>
-                    </form>
-                </div>
-            </div>
-        </div>
-    </body>
-    </html>
-    '''
-
-@app.route('/admin/start', methods=['POST'])
+    return render_template('admin_init.html')
+
+@queue_pages.route('/admin/start', methods=['POST'])
 def start_queue():
     business_name = request.form.get('business_name', 'Business Name')
     created_by = request.form.get('created_by', 'Manager')
-    set_queue_active(True, business_name, created_by)
-    return redirect('/admin')
+    counters = parse_counters(request.form.get('counters', ''))
+    set_queue_active(True, business_name, created_by, counters, prerender=True)
+    notify_queue_changed()
+    return redirect(url_for('.admin_panel'))
 
-@app.route('/admin')
+@queue_pages.route('/admin')
+@conditional_on_state
 def admin_panel():
     if not is_queue_active():
-        return redirect('/admin/init')
+        return redirect(url_for('.admin_init'))
     
-    current_number, waiting, total_waiting = get_queue_data()
+    snapshot = get_admin_snapshot(get_admin_page())
     business_name, created_by, session_started = get_business_info()
     
-    join_url = f"{request.url_root}join"
-    status_url = f"{request.url_root}status"
-    join_qr = generate_qr_code(join_url)
-    status_qr = generate_qr_code(status_url)
-    
-    total_customers = len(queue_data['queue']) + len(queue_data['served_numbers'])
-    served_today = len(queue_data['served_numbers'])
+    join_url = url_for('.join_queue', _external=True)
+    status_url = url_for('.queue_status', _external=True)
+    join_qr = url_for('.qr_image', kind='join')
+    status_qr = url_for('.qr_image', kind='status')
     
-    return f'''
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Admin Dashboard</title>
-        {BASE_STYLE}
-    </head>
-    <body>
-        <div class="container">
-            <div class="header">
-                <h1>⚙️ Queue Management Dashboard</h1>
-                <p>{business_name} • Managed by {created_by}</p>
-            </div>
-
-            <div class="grid grid-3">
-                <div class="stat-card">
-                    <div class="stat-number">{current_number if current_number else '--'}</div>
-                    <div>Now Serving</div>
-                </div>
-                <div class="stat-card">
-                    <div class="stat-number">{total_customers}</div>
-                    <div>Total Today</div>
-                </div>
-                <div class="stat-card">
-                    <div class="stat-number">{served_today}</div>
-                    <div>Served</div>
-                </div>
-            </div>
-
-            <div class="grid grid-2">
-                <div class="card">
-                    <h3 style="margin-bottom: 1rem;">Queue Actions</h3>
-                    <div style="display: flex; gap: 1rem; flex-wrap: wrap;">
-                        <form action="/admin/next" method="POST" style="display: inline;">
-                            <button type="submit" class="btn btn-primary">✅ Serve Next</button>
-                        </form>
-                        <form action="/admin/add" method="POST" style="display: inline;">
-                            <button type="submit" class="btn">➕ Add Entry</button>
-                        </form>
-                        <form action="/admin/end" method="POST" style="display: inline;">
-                            <button type="submit" class="btn btn-danger">🛑 End Session</button>
-                        </form>
-                    </div>
-                </div>
-
-                <div class="card">
-                    <h3 style="margin-bottom: 1rem;">Quick Links</h3>
-                    <div style="display: flex; gap: 1rem;">
-                        <a href="{join_url}" target="_blank" class="btn btn-secondary">Join Page</a>
-                        <a href="{status_url}" target="_blank" class="btn btn-secondary">Status Page</a>
-                    </div>
-                </div>
-            </div>
-
-            <div class="grid grid-2">
-                <div class="card">
-                    <h3 style="margin-bottom: 1rem;">Join Queue QR</h3>
-                    <div class="qr-code">
-                        <img src="{join_qr}" alt="Join QR" style="width: 100%; border-radius: 8px;">
-                    </div>
-                </div>
-                
-                <div class="card">
-                    <h3 style="margin-bottom: 1rem;">Status QR</h3>
-                    <div class="qr-code">
-                        <img src="{status_qr}" alt="Status QR" style="width: 100%; border-radius: 8px;">
-                    </div>
-                </div>
-            </div>
-
-            <div class="card">
-                <h3 style="margin-bottom: 1rem;">Waiting Queue ({len(waiting)} customers)</h3>
-                <div style="min-height: 100px;">
-                    {' '.join([f"""
-                    <div style="display: inline-block; background: white; padding: 1rem; margin: 0.5rem; border-radius: 8px; border: 1px solid #e2e8f0; position: relative;">
-                        #{num}
-                        <form action="/admin/remove/{num}" method="POST" style="display: inline; position: absolute; top: -8px; right: -8px;">
-                            <button type="submit" style="background: #e53e3e; color: white; border: none; border-radius: 50%; width: 24px; height: 24px; cursor: pointer;">×</button>
-                        </form>
-                    </div>
-                    """ for num in waiting]) if waiting else '<p style="color: #718096; text-align: center;">No customers waiting</p>'}
-                </div>
-            </div>
-        </div>
-    </body>
-    </html>
-    '''
-
-@app.route('/admin/next', methods=['POST'])
+    return render_template('admin_panel.html', business_name=business_name, created_by=created_by,
+                           join_url=join_url, status_url=status_url,
+                           join_qr=join_qr, status_qr=status_qr, bulk_limit=ADMIN_BULK_LIMIT, print_limit=PRINT_LIMIT,
+                           lanes=[(lane, LANE_LABELS[lane]) for lane in (*LANES, APPOINTMENT_LANE)],
+                           default_lane=DEFAULT_LANE, **snapshot)
+
+@queue_pages.route('/admin/stream')
+def admin_stream():
+    page = get_admin_page()
+    return stream_changes(lambda: get_admin_snapshot(page))
+
+@queue_pages.route('/admin/live')
+def admin_live():
+    page = get_admin_page()
+    return version_response(lambda: get_admin_snapshot(page))
+
+@queue_pages.route('/admin/next', methods=['POST'])
 def serve_next():
     if not is_queue_active():
-        return redirect('/admin/init')
-    
-    current_number = queue_data['serving_number']
+        return redirect(url_for('.admin_init'))
     
-    if current_number > 0:
-        if current_number in queue_data['queue']:
-            queue_data['queue'].remove(current_number)
-        queue_data['served_numbers'].append(current_number)
+    count = get_bulk_count()
+    try:
+        store.serve_next(request.form.get('counter') or None, count)
+    except KeyError:
+        abort(404)
+    notify_queue_changed()
+    tickets_served.inc()
     
-    if queue_data['queue']:
-        next_number = min(queue_data['queue'])
-        queue_data['serving_number'] = next_number
-    else:
-        queue_data['serving_number'] = 0
-    
-    return redirect('/admin')
+    return admin_action_response()
 
-@app.route('/admin/add', methods=['POST'])
+@queue_pages.route('/admin/add', methods=['POST'])
 def add_manual():
     if not is_queue_active():
-        return redirect('/admin/init')
+        return redirect(url_for('.admin_init'))
     
-    if queue_data['queue']:
-        next_number = max(queue_data['queue']) + 1
-    else:
-        next_number = 1
+    count = get_bulk_count()
+    lane, slot = get_lane_choice()
+    added = store.add_tickets(count, lane, slot) if count > 1 else [store.add_ticket(lane, slot)]
+    notify_queue_changed()
+    tickets_joined.inc(count, labels=('admin',))
+    return admin_action_response(added=added)
+
+@queue_pages.route('/admin/remove/<int:queue_number>', methods=['POST'])
+def remove_customer(queue_number):
+    if not is_queue_active():
+        return redirect(url_for('.admin_init'))
+    
+    if store.remove_ticket(queue_number):
+        notify_queue_changed()
+        tickets_removed.inc()
     
-    queue_data['queue'].append(next_number)
-    return redirect('/admin')
+    return admin_action_response()
 
-@app.route('/admin/remove/<int:queue_number>', methods=['POST'])
-def remove_customer(queue_number):
+@queue_pages.route('/admin/remove', methods=['POST'])
+def remove_customers():
     if not is_queue_active():
-        return redirect('/admin/init')
+        return redirect(url_for('.admin_init'))
     
-    if queue_number in queue_data['queue']:
-        queue_data['queue'].remove(queue_number)
+    removed = store.remove_tickets(parse_ticket_numbers(request.form.get('numbers', '')))
+    if removed:
+        notify_queue_changed()
+        tickets_removed.inc(len(removed))
     
-    return redirect('/admin')
+    return admin_action_response(removed=removed)
+
+# Available after the session ends too, until the next one starts
+@queue_pages.route('/admin/export.<fmt>')
+def export_session(fmt):
+    if fmt not in EXPORT_FORMATS:
+        abort(404)
+    return stream_export(fmt)
 
-@app.route('/admin/end', methods=['POST'])
+@queue_pages.route('/admin/end', methods=['POST'])
 def end_queue():
     set_queue_active(False)
-    return redirect('/admin/init')
+    notify_queue_changed()
+    return redirect(url_for('.admin_init'))
+
+# Paper tickets: reserves a block of numbers in one batch and streams a PDF
+# with a page per ticket, its QR code opening the ticket's status page
+def reserve_printed_tickets(count, lane=DEFAULT_LANE, slot=None):
+    numbers = store.add_tickets(count, lane, slot)
+    notify_queue_changed()
+    tickets_joined.inc(count, labels=('print',))
+    return numbers
+
+def printed_tickets_pdf(numbers):
+    business_name, created_by, session_started = get_business_info()
+    return ticket_pdf(numbers, lambda number: url_for('.user_queue_status', queue_number=number, _external=True),
+                      business_name)
+
+@queue_pages.route('/admin/print', methods=['POST'])
+def print_tickets():
+    if not is_queue_active():
+        return redirect(url_for('.admin_init'))
+    
+    count = request.form.get('count', 1, type=int)
+    if not 1 <= count <= PRINT_LIMIT:
+        abort(400)
+    lane, slot = get_lane_choice()
+    numbers = reserve_printed_tickets(count, lane, slot)
+    response = Response(stream_with_context(printed_tickets_pdf(numbers)), mimetype='application/pdf')
+    response.headers['Content-Disposition'] = f'attachment; filename="tickets-{numbers[0]}-{numbers[-1]}.pdf"'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def qr_cache_status():
+    return jsonify(get_qr_cache_stats())
+
+# flask --app 'main:create_app()' print-tickets 200 -o tickets.pdf
+@click.command('print-tickets', help='Reserve COUNT tickets and write them as a printable PDF.')
+@click.argument('count', type=click.IntRange(1, PRINT_LIMIT))
+@click.option('--queue', 'queue_id', default=DEFAULT_QUEUE_ID, help='Queue to reserve the tickets in.')
+@click.option('--lane', type=click.Choice(LANES), default=DEFAULT_LANE)
+@click.option('--base-url', default=PUBLIC_URL or 'http://localhost:5000',
+              help='Public address the QR codes point to.')
+@click.option('-o', '--output', type=click.File('wb'), default='tickets.pdf')
+@with_appcontext
+def print_tickets_command(count, queue_id, lane, base_url, output):
+    if not QUEUE_ID_PATTERN.fullmatch(queue_id):
+        raise click.BadParameter('not a valid queue id', param_hint='--queue')
+    if queues.get(queue_id) is None:
+        raise click.ClickException(f"queue '{queue_id}' does not exist")
+    path = '/' if queue_id == DEFAULT_QUEUE_ID else f'/q/{queue_id}/'
+    with current_app.test_request_context(path, base_url=base_url):
+        current_app.preprocess_request()
+        if not is_queue_active():
+            raise click.ClickException(f"queue '{queue_id}' has no active session")
+        numbers = reserve_printed_tickets(count, lane)
+        for chunk in printed_tickets_pdf(numbers):
+            output.write(chunk)
+    click.echo(f"Tickets #{numbers[0]}-#{numbers[-1]} written to {output.name}")
+
+def warm_up(app):
+    started = time.perf_counter()
+    render_qr_code('warm-up')
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    if PUBLIC_URL:
+        with app.test_request_context('/', base_url=PUBLIC_URL):
+            if is_queue_active():
+                prerender_qr_codes()
+    app.logger.info("Warm-up finished in %.1f ms", (time.perf_counter() - started) * 1000)
+
+def start_warm_up(app):
+    threading.Thread(target=warm_up, args=(app,), name='warm-up', daemon=True).start()
+
+# Application factory: `gunicorn 'main:create_app()'`. Queue state, caches
+# and metrics are per process, shared by every app created in it.
+def create_app():
+    app = Flask(__name__)
+    app.secret_key = SECRET_KEY
+    app.config['SITE_FINGERPRINT'] = site_fingerprint(app)
+    if TRUSTED_PROXIES:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES,
+                                x_host=TRUSTED_PROXIES)
+    app.jinja_env.globals['asset_url'] = asset_url
+    remove_stale_spills()
+    
+    # after_request hooks run in reverse: asset caching, compression, then
+    # metrics last so request durations include compression
+    app.before_request(start_request_timer)
+    app.after_request(record_request_metrics)
+    app.after_request(compress_response)
+    app.after_request(cache_fingerprinted_assets)
+    before_render_template.connect(start_template_timer, app)
+    template_rendered.connect(record_template_time, app)
+    
+    app.cli.add_command(print_tickets_command)
+    app.add_url_rule('/metrics', view_func=metrics_endpoint)
+    app.add_url_rule('/admin/qr-cache', view_func=qr_cache_status)
+    app.register_blueprint(queue_pages)
+    app.register_blueprint(queue_pages, url_prefix='/q/<queue_id>', name='tenant')
+    
+    if WARMUP:
+        start_warm_up(app)
+    return app
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
+    create_app().run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
@@ -0,0 +1,139 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# Most routes finish well under 5ms, so the low end is finer than the
+# usual Prometheus defaults
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labelnames, labels, extra=()):
+    pairs = list(zip(labelnames, labels, strict=True)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped, strict=True)) + '}'
+
+
+# Checked when a series is first seen, so a wrong call fails where it is
+# made rather than on the next scrape
+def _check_labels(metric, labels):
+    if len(labels) != len(metric.labelnames):
+        raise ValueError(f'{metric.name} takes labels {metric.labelnames}, got {labels!r}')
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, labels=()):
+        with self._lock:
+            if labels not in self._values:
+                _check_labels(self, labels)
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield f'{self.name}{_format_labels(self.labelnames, labels)} {value}'
+
+
+# Value read from a callback at scrape time
+class Gauge:
+    type = 'gauge'
+
+    def __init__(self, name, documentation, callback):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+
+    def collect(self):
+        yield f'{self.name} {self.callback()}'
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, labels=()):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                _check_labels(self, labels)
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, labels=()):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, labels)
+
+    def collect(self):
+        with self._lock:
+            series = {labels: (list(counts), total) for labels, (counts, total) in self._series.items()}
+        for labels, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts, strict=True):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield f'{self.name}_bucket{_format_labels(self.labelnames, labels, [("le", le)])} {cumulative}'
+            label_text = _format_labels(self.labelnames, labels)
+            yield f'{self.name}_sum{label_text} {total}'
+            yield f'{self.name}_count{label_text} {cumulative}'
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, callback):
+        return self.register(Gauge(name, documentation, callback))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+def timed(histogram, labels=()):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with histogram.time(labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,167 @@
+import multiprocessing
+import os
+import threading
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+
+# Worker processes for QR rendering (0 renders in this process instead) and
+# tickets per task; at most two tasks per worker are in flight, so memory
+# stays flat however many tickets are printed
+PRINT_WORKERS = int(os.environ.get('PRINT_WORKERS', os.cpu_count() or 1))
+PRINT_BATCH = int(os.environ.get('PRINT_BATCH', 16))
+
+# A6 ticket, in points
+PAGE_WIDTH = 298
+PAGE_HEIGHT = 420
+QR_SIZE = 200
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# Spawned rather than forked: the server process has threads of its own
+def get_pool(workers=PRINT_WORKERS):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+# A worker that died takes the pool with it; the next print run starts a new one
+def discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+# One QR module per pixel, 1-bit grey (dark modules 0), rows padded to a
+# byte and deflated; the PDF scales it up without smoothing. Returns
+# (size, data).
+def render_qr_matrix(url):
+    import qrcode
+    from qrcode.constants import ERROR_CORRECT_M
+
+    qr = qrcode.QRCode(error_correction=ERROR_CORRECT_M, border=4)
+    qr.add_data(url)
+    qr.make(fit=True)
+    matrix = qr.get_matrix()
+    size = len(matrix)
+    padding = -size % 8
+    pixels = bytearray()
+    for row in matrix:
+        bits = 0
+        for dark in row:
+            bits = bits << 1 | (not dark)
+        pixels += (bits << padding).to_bytes((size + padding) // 8, 'big')
+    return size, zlib.compress(bytes(pixels))
+
+
+def render_qr_batch(urls):
+    return [render_qr_matrix(url) for url in urls]
+
+
+def render_qr_matrices(urls, workers=PRINT_WORKERS, batch_size=PRINT_BATCH):
+    urls = iter(urls)
+    batches = iter(lambda: list(islice(urls, batch_size)), [])
+    if workers <= 0:
+        for batch in batches:
+            yield from render_qr_batch(batch)
+        return
+    pool = get_pool(workers)
+    pending = deque()
+    try:
+        for batch in batches:
+            pending.append(pool.submit(render_qr_batch, batch))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    except BrokenProcessPool:
+        discard_pool(pool)
+        raise
+
+
+def pdf_text(value):
+    value = value.encode('cp1252', errors='replace')
+    return b'(' + value.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+# Writes a PDF front to back: objects are emitted as they are made and
+# only their offsets are kept for the cross-reference table at the end
+class PDFWriter:
+    def __init__(self):
+        self.position = 0
+        self.offsets = []
+
+    def reserve(self):
+        self.offsets.append(None)
+        return len(self.offsets)
+
+    def _emit(self, data):
+        self.position += len(data)
+        return data
+
+    def header(self):
+        return self._emit(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def object(self, number, body):
+        self.offsets[number - 1] = self.position
+        return self._emit(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+
+    def stream(self, number, attributes, data):
+        return self.object(number, b'<< %s /Length %d >>\nstream\n%s\nendstream' % (attributes, len(data), data))
+
+    def trailer(self, root):
+        xref = self.position
+        entries = b''.join(b'%010d 00000 n \n' % offset for offset in self.offsets)
+        return self._emit(
+            b'xref\n0 %d\n0000000000 65535 f \n%s' % (len(self.offsets) + 1, entries)
+            + b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(self.offsets) + 1, root, xref)
+        )
+
+
+# Helvetica is not embedded, so centring uses its digit width (556/1000
+# em, exact for "#123") and an average of half an em for other text
+def centred_text(font, size, y, text, char_width=0.5):
+    x = max(12, (PAGE_WIDTH - len(text) * size * char_width) / 2)
+    return b'BT /%s %d Tf %.1f %d Td %s Tj ET\n' % (font, size, x, y, pdf_text(text))
+
+
+def ticket_page(number, title):
+    qr_left = (PAGE_WIDTH - QR_SIZE) // 2
+    return b''.join((
+        centred_text(b'F2', 16, 385, title[:34]),
+        centred_text(b'F2', 44, 330, f'#{number}', char_width=0.556),
+        b'q %d 0 0 %d %d 105 cm /QR Do Q\n' % (QR_SIZE, QR_SIZE, qr_left),
+        centred_text(b'F1', 10, 80, 'Scan to track your place in the queue'),
+    ))
+
+
+# One A6 page per ticket: `url(number)` is what its QR code opens.
+# Yields the PDF in pieces as the QR codes come back from the pool.
+def ticket_pdf(numbers, url, title, workers=PRINT_WORKERS):
+    pdf = PDFWriter()
+    catalog, pages, font, bold = (pdf.reserve() for _ in range(4))
+    yield pdf.header()
+    yield pdf.object(font, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')
+    yield pdf.object(bold, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>')
+    kids = []
+    for number, (size, pixels) in zip(numbers, render_qr_matrices(map(url, numbers), workers), strict=True):
+        page, contents, image = pdf.reserve(), pdf.reserve(), pdf.reserve()
+        yield pdf.stream(image, b'/Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceGray '
+                                b'/BitsPerComponent 1 /Interpolate false /Filter /FlateDecode' % (size, size), pixels)
+        yield pdf.stream(contents, b'', ticket_page(number, title))
+        yield pdf.object(page, b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R '
+                               b'/Resources << /Font << /F1 %d 0 R /F2 %d 0 R >> /XObject << /QR %d 0 R >> >> >>'
+                               % (pages, PAGE_WIDTH, PAGE_HEIGHT, contents, font, bold, image))
+        kids.append(page)
+    yield pdf.object(pages, b'<< /Type /Pages /Kids [%s] /Count %d >>'
+                     % (b' '.join(b'%d 0 R' % kid for kid in kids), len(kids)))
+    yield pdf.object(catalog, b'<< /Type /Catalog /Pages %d 0 R >>' % pages)
+    yield pdf.trailer(catalog)
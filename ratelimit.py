@@ -0,0 +1,38 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+# Token bucket per client key: `rate` tokens per second up to `burst`.
+# Buckets are kept in an LRU bounded at max_clients, so a flood of
+# distinct addresses cannot grow memory; an evicted client just starts
+# again with a full bucket.
+class TokenBucketLimiter:
+    def __init__(self, rate, burst, max_clients=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    # 0 when a token was taken, otherwise seconds until one is available
+    def acquire(self, key, now=None):
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                tokens = self.burst
+                if len(self._buckets) >= self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                self._buckets.move_to_end(key)
+            if tokens >= 1:
+                self._buckets[key] = [tokens - 1, now]
+                return 0
+            self._buckets[key] = [tokens, now]
+            return (1 - tokens) / self.rate
@@ -0,0 +1,78 @@
+(function () {
+    var admin = document.getElementById('admin');
+    var list = document.getElementById('waiting-list');
+    var version = null;
+    // Requests are numbered as they are sent; a response to one sent before
+    // the last rendered one may carry older state and is dropped
+    var sent = 0, shown = 0;
+
+    function removeForm(num) {
+        var action = list.dataset.removeUrl.replace('/remove/0', '/remove/' + num);
+        return '<div class="waiting-ticket">#' + num +
+            ' <form action="' + action + '" method="POST" class="remove-form" data-async>' +
+            '<button type="submit" class="remove-btn">×</button></form></div>';
+    }
+
+    function render(data, seq) {
+        if (seq < shown) { return; }
+        shown = seq;
+        if (!data.active) { location.reload(); return; }
+        version = data.version;
+        document.getElementById('waiting-count').textContent = data.total_waiting;
+        document.getElementById('waiting-total').textContent = data.total_waiting;
+        document.getElementById('total-customers').textContent = data.total_customers;
+        document.getElementById('served-today').textContent = data.served_today;
+        document.getElementById('page-count').textContent = data.pages;
+        document.getElementById('next-page').hidden = data.page >= data.pages;
+        Array.prototype.forEach.call(document.querySelectorAll('[data-counter]'), function (el) {
+            el.textContent = data.counters[el.dataset.counter] || '--';
+        });
+        list.innerHTML = data.waiting.length
+            ? data.waiting.map(removeForm).join('')
+            : '<p style="color: #718096; text-align: center;">No customers waiting</p>';
+    }
+
+    document.addEventListener('submit', function (event) {
+        var form = event.target;
+        if (!form.hasAttribute('data-async') || !window.fetch) { return; }
+        event.preventDefault();
+        var seq = ++sent;
+        fetch(form.action, { method: 'POST', body: new FormData(form), headers: { 'Accept': 'application/json' } })
+            .then(function (response) {
+                var json = (response.headers.get('Content-Type') || '').indexOf('application/json') === 0;
+                if (!response.ok || !json) { location.reload(); return null; }
+                return response.json();
+            })
+            .then(function (data) { if (data) { form.reset(); render(data, seq); } });
+    });
+
+    // Follows the event stream while the page is visible, reopening it with
+    // the version last seen; a hidden page holds no connection
+    var source = null;
+    function follow() {
+        if (document.hidden) {
+            if (source) { source.close(); source = null; }
+        } else if (!source) {
+            source = new EventSource(admin.dataset.stream + (version === null ? '' : '&version=' + encodeURIComponent(version)));
+            source.onmessage = function (event) { render(JSON.parse(event.data), ++sent); };
+        }
+    }
+
+    // Without EventSource: polls with the version it last rendered; unchanged
+    // state is an empty 304
+    function poll() {
+        if (document.hidden) { setTimeout(poll, 5000); return; }
+        var seq = ++sent;
+        fetch(admin.dataset.poll + (version === null ? '' : '&version=' + encodeURIComponent(version)))
+            .then(function (response) { return response.status === 304 ? null : response.json(); })
+            .then(function (data) { if (data) { render(data, seq); } })
+            .catch(function () {})
+            .then(function () { setTimeout(poll, 5000); });
+    }
+    if (window.EventSource) {
+        follow();
+        document.addEventListener('visibilitychange', follow);
+    } else if (window.fetch) {
+        setTimeout(poll, 5000);
+    }
+})();
@@ -1,7 +1,12 @@
+var statusVersion = null;
+
 function updateStatus() {
-  fetch('/current_status')
-      .then(response => response.json())
+  var url = statusVersion === null ? '/current_status' : '/current_status?version=' + encodeURIComponent(statusVersion);
+  fetch(url)
+      .then(response => response.status === 304 ? null : response.json())
       .then(data => {
+          if (!data) return;
+          statusVersion = data.version;
           document.getElementById('current-number').innerText = data.current_number;
           document.getElementById('queue-length').innerText = data.queue_length;
           document.getElementById('wait-time').innerText = data.average_wait_time;
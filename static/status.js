@@ -0,0 +1,48 @@
+(function () {
+    var list = document.getElementById('waiting-list');
+    if (!window.fetch && !window.EventSource) { setTimeout(function () { location.reload(); }, 15000); return; }
+    var version = null;
+
+    function render(data) {
+        if (!data.active) { location.reload(); return; }
+        document.getElementById('now-serving').textContent = data.now_serving || '--';
+        document.getElementById('waiting-count').textContent = data.total_waiting;
+        document.getElementById('wait-time').textContent = data.wait_time;
+        Array.prototype.forEach.call(document.querySelectorAll('[data-counter]'), function (el) {
+            el.textContent = data.counters[el.dataset.counter] || '--';
+        });
+        var more = data.total_waiting - data.waiting.length;
+        list.innerHTML = (data.waiting.length
+            ? data.waiting.map(function (num) { return '<span class="waiting-chip">#' + num + '</span>'; }).join(' ')
+            : '<p style="color: #718096; text-align: center;">No customers waiting</p>')
+            + (more > 0 ? ' <span style="color: #718096;">+' + more + ' more</span>' : '');
+    }
+
+    // Follows the event stream while the page is visible, reopening it with
+    // the version last seen; a hidden page holds no connection
+    var source = null;
+    function follow() {
+        if (document.hidden) {
+            if (source) { source.close(); source = null; }
+        } else if (!source) {
+            source = new EventSource(list.dataset.stream + (version === null ? '' : '?version=' + encodeURIComponent(version)));
+            source.onmessage = function (event) { var data = JSON.parse(event.data); version = data.version; render(data); };
+        }
+    }
+
+    // Without EventSource: polls, and unchanged state comes back as an empty 304
+    function poll() {
+        if (document.hidden) { setTimeout(poll, 5000); return; }
+        fetch(list.dataset.poll + (version === null ? '' : '?version=' + encodeURIComponent(version)))
+            .then(function (response) { return response.status === 304 ? null : response.json(); })
+            .then(function (data) { if (data) { version = data.version; render(data); } })
+            .catch(function () {})
+            .then(function () { setTimeout(poll, 5000); });
+    }
+    if (window.EventSource) {
+        follow();
+        document.addEventListener('visibilitychange', follow);
+    } else {
+        setTimeout(poll, 5000);
+    }
+})();
@@ -0,0 +1,55 @@
+(function () {
+    var ticket = document.getElementById('ticket');
+    var status = ticket.dataset.status;
+
+    // A scheduled appointment's wait is the time left until its slot, which
+    // runs out without the queue state changing, so it is counted down here
+    var slot = ticket.dataset.slot ? parseFloat(ticket.dataset.slot) : null;
+    function countDown() {
+        if (slot === null) { return; }
+        document.getElementById('wait-time').textContent = Math.max(0, Math.ceil((slot * 1000 - Date.now()) / 60000));
+    }
+    countDown();
+    setInterval(countDown, 15000);
+
+    if (!window.fetch && !window.EventSource) { setTimeout(function () { location.reload(); }, 30000); return; }
+    var version = null;
+
+    function render(data) {
+        if (!data.active || data.status !== status) { location.reload(); return; }
+        document.getElementById('now-serving').textContent = data.now_serving || '--';
+        document.getElementById('wait-time').textContent = data.wait_time;
+        slot = data.slot;
+        countDown();
+        var position = document.getElementById('position');
+        if (position) { position.textContent = data.position; }
+    }
+
+    // Follows the event stream while the page is visible, reopening it with
+    // the version last seen; a hidden page holds no connection
+    var source = null;
+    function follow() {
+        if (document.hidden) {
+            if (source) { source.close(); source = null; }
+        } else if (!source) {
+            source = new EventSource(ticket.dataset.stream + (version === null ? '' : '?version=' + encodeURIComponent(version)));
+            source.onmessage = function (event) { var data = JSON.parse(event.data); version = data.version; render(data); };
+        }
+    }
+
+    // Without EventSource: polls, and unchanged state comes back as an empty 304
+    function poll() {
+        if (document.hidden) { setTimeout(poll, 5000); return; }
+        fetch(ticket.dataset.poll + (version === null ? '' : '?version=' + encodeURIComponent(version)))
+            .then(function (response) { return response.status === 304 ? null : response.json(); })
+            .then(function (data) { if (data) { version = data.version; render(data); } })
+            .catch(function () {})
+            .then(function () { setTimeout(poll, 5000); });
+    }
+    if (window.EventSource) {
+        follow();
+        document.addEventListener('visibilitychange', follow);
+    } else {
+        setTimeout(poll, 5000);
+    }
+})();
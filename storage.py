@@ -0,0 +1,969 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from itertools import islice
+
+from estimator import WINDOW, ServiceRateEstimator
+from eventlog import EventLog
+from history import TicketLedger
+from ticket_queue import LaneQueue
+
+DEFAULT_QUEUE_ID = 'default'
+QUEUE_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,64}')
+QUEUE_IDLE_SECONDS = float(os.environ.get('QUEUE_IDLE_SECONDS', 1800))
+MAX_QUEUES = int(os.environ.get('MAX_QUEUES', 1000))
+DEFAULT_COUNTER = 'Counter 1'
+MAX_COUNTERS = 50
+# Walk-in service lanes, called in this order. Appointments (tickets with a
+# slot time) go ahead of all of them once their slot has come.
+LANES = ('vip', 'priority', 'standard')
+DEFAULT_LANE = 'standard'
+APPOINTMENT_LANE = 'appointment'
+
+
+def normalize_counters(counters):
+    names = []
+    for name in counters or ():
+        name = ' '.join(str(name).split())[:40]
+        if name and name not in names:
+            names.append(name)
+    return names[:MAX_COUNTERS] or [DEFAULT_COUNTER]
+
+
+def check_lane(lane, slot):
+    if lane == APPOINTMENT_LANE:
+        if slot is None:
+            raise ValueError('appointments need a slot time')
+    elif lane not in LANES:
+        raise KeyError(lane)
+    elif slot is not None:
+        raise ValueError('only appointments have a slot time')
+
+
+# Per-queue plumbing shared by both backends: change notification for
+# live streams and data derived from the state, cached per version
+class QueueStore:
+    def __init__(self):
+        self.changed = threading.Condition()
+        self.last_used = time.monotonic()
+        self._derived = {}
+        self._derived_lock = threading.RLock()
+        self._epoch = os.urandom(4).hex()
+
+    def notify_changed(self):
+        with self.changed:
+            self.changed.notify_all()
+
+    # Mutations in this process wake waiters at once; changes made by other
+    # workers are picked up when the version is re-read after the timeout
+    def wait_for_change(self, version, timeout):
+        with self.changed:
+            if self.get_version() == version:
+                self.changed.wait(timeout)
+
+    # Versions restart when a store is recreated; the epoch tells such
+    # states apart in ETags
+    def get_epoch(self):
+        return self._epoch
+
+    # Builds are single-flight: concurrent readers of a stale entry wait
+    # for one build instead of each doing their own. Storing an entry drops
+    # those left from older versions.
+    def cached(self, key, build):
+        version = self.get_version()
+        entry = self._derived.get(key)
+        if entry is None or entry[0] != version:
+            with self._derived_lock:
+                entry = self._derived.get(key)
+                if entry is None or entry[0] != version:
+                    entry = (version, build())
+                    for stale in [stale for stale, (built, _) in self._derived.items() if built != version]:
+                        del self._derived[stale]
+                    self._derived[key] = entry
+        return entry[1]
+
+    def can_evict(self):
+        return True
+
+    def close(self):
+        pass
+
+
+def _lane_args(lane, slot):
+    return () if lane == DEFAULT_LANE else (lane, slot)
+
+
+# Single-process storage: the original in-memory queue_data dict.
+# 'queue' holds waiting tickets only, by lane; 'counters' maps each service counter
+# to the ticket it is serving (0 when idle) and 'serving' is the reverse.
+# 'ledger' records each ticket's join/call/serve/remove times for export
+# and answers which tickets were served.
+# Mutations and index lookups hold one lock; the waiting list is published
+# as an immutable snapshot per version so status pages read it lock-free.
+#
+# Every mutation is an event applied by an _apply_<kind> method. With an
+# EventLog the event is appended before it is applied, and the store is
+# rebuilt from the last snapshot plus the logged tail on startup.
+class MemoryStore(QueueStore):
+    def __init__(self, log=None):
+        super().__init__()
+        self.lock = threading.RLock()
+        self.data = {
+            'is_active': False,
+            'business_name': 'Business Name',
+            'created_by': 'Manager',
+            'session_started': None,
+            'queue': LaneQueue(LANES),
+            'counters': {DEFAULT_COUNTER: 0},
+            'serving': {},
+            'ledger': TicketLedger(path=log.ledger_path if log is not None else None),
+            'ticket_seq': 0,
+            'version': 0
+        }
+        self.estimator = ServiceRateEstimator()
+        self._queue_snapshot = (None, None)
+        self._next_slot = None
+        self.log = log
+        if log is not None:
+            self._recover()
+
+    # Bumped on every mutation so readers can tell whether anything changed
+    # An appointment coming due reorders the queue without a mutation, so
+    # the first read after its slot records a 'due' event to bump the version
+    def get_version(self):
+        next_slot = self._next_slot
+        if next_slot is not None and next_slot <= time.time():
+            with self.lock:
+                next_slot = self._next_slot
+                if next_slot is not None and next_slot <= time.time():
+                    self._record('due')
+        return self.data['version']
+
+    def is_active(self):
+        return self.data['is_active']
+
+    # An idle queue with no session holds nothing worth keeping
+    def can_evict(self):
+        return not self.data['is_active']
+
+    def close(self):
+        with self.lock:
+            self.data['ledger'].close()
+            if self.log is not None:
+                self.log.close()
+
+    # Callers hold the lock. The event's second field is the version it
+    # produces, which also orders it against snapshots.
+    def _record(self, kind, *args):
+        event = [kind, self.data['version'] + 1, *args]
+        snapshot_due = self.log is not None and self.log.append(event)
+        self._apply(event)
+        self._next_slot = self.data['queue'].next_slot(time.time())
+        if snapshot_due:
+            self.log.write_snapshot(self._snapshot_state(), self.data['ledger'].sync)
+
+    def _apply(self, event):
+        kind, version, *args = event
+        getattr(self, f'_apply_{kind}')(*args)
+        self.data['version'] = version
+
+    def _recover(self):
+        snapshot, events = self.log.load()
+        with self.lock:
+            if snapshot is not None:
+                self._restore(snapshot)
+            else:
+                self.data['ledger'].truncate(0)
+            for event in events:
+                self._apply(event)
+            self._next_slot = self.data['queue'].next_slot(time.time())
+
+    # Live state only: finished tickets are already in the ledger's file,
+    # so the snapshot records how many there were
+    def _snapshot_state(self):
+        data = self.data
+        data['ledger'].flush()
+        session_started = data['session_started']
+        return {
+            'version': data['version'],
+            'is_active': data['is_active'],
+            'business_name': data['business_name'],
+            'created_by': data['created_by'],
+            'session_started': session_started.isoformat(sep=' ') if session_started else None,
+            'queue': list(data['queue']),
+            'lanes': [list(ticket) for ticket in data['queue'].tickets() if ticket[1] != DEFAULT_LANE],
+            'counters': list(data['counters'].items()),
+            'ticket_seq': data['ticket_seq'],
+            'active': [[number, *record] for number, record in data['ledger'].active.items()],
+            'finished': data['ledger'].finished,
+        }
+
+    def _restore(self, state):
+        data = self.data
+        data['is_active'] = state['is_active']
+        data['business_name'] = state['business_name']
+        data['created_by'] = state['created_by']
+        session_started = state['session_started']
+        data['session_started'] = datetime.fromisoformat(session_started) if session_started else None
+        lanes = {number: (lane, slot) for number, lane, slot in state.get('lanes', ())}
+        data['queue'] = LaneQueue(LANES, ((number, *lanes.get(number, (DEFAULT_LANE, None)))
+                                          for number in state['queue']))
+        data['counters'] = dict(state['counters'])
+        data['serving'] = {number: name for name, number in state['counters'] if number}
+        ledger = data['ledger']
+        if isinstance(state['finished'], list):
+            # Snapshots from before the ledger was kept beside the log
+            ledger.truncate(0)
+            ledger.extend(state['finished'])
+        else:
+            ledger.truncate(state['finished'])
+        ledger.active = {number: record for number, *record in state['active']}
+        # Older snapshots predate the counter: carry on after the live tickets
+        data['ticket_seq'] = state.get('ticket_seq', max(ledger.active, default=0))
+        self.estimator.reset()
+        for served_at in data['ledger'].served_times(WINDOW + 1):
+            self.estimator.record(served_at)
+        data['version'] = state['version']
+
+    def set_active(self, active, business_name, created_by, counters=None):
+        with self.lock:
+            if active:
+                self._record('session', True, business_name, created_by, normalize_counters(counters),
+                             datetime.now().isoformat(sep=' '))
+            else:
+                self._record('session', False, business_name, created_by, None, None)
+
+    def _apply_session(self, active, business_name, created_by, counters, session_started):
+        data = self.data
+        data['is_active'] = active
+        data['business_name'] = business_name
+        data['created_by'] = created_by
+        if active:
+            data['session_started'] = datetime.fromisoformat(session_started)
+            data['queue'] = LaneQueue(LANES)
+            data['counters'] = dict.fromkeys(counters, 0)
+            data['serving'] = {}
+            data['ticket_seq'] = 0
+            data['ledger'].clear()
+            self.estimator.reset()
+
+    # Only the version changes: an appointment's slot has come
+    def _apply_due(self):
+        pass
+
+    def get_business_info(self):
+        data = self.data
+        return data['business_name'], data['created_by'], data['session_started']
+
+    # Waiting tickets in call order as of the last change
+    def get_queue_data(self):
+        version, snapshot = self._queue_snapshot
+        if version == self.get_version():
+            return snapshot
+        with self.lock:
+            version = self.data['version']
+            waiting = tuple(self.data['queue'].ordered(time.time()))
+            snapshot = (dict(self.data['counters']), waiting, len(waiting))
+            self._queue_snapshot = (version, snapshot)
+        return snapshot
+
+    # One page of the waiting list in call order, read from the lane
+    # indexes without building the rest of it
+    def get_waiting_page(self, offset, limit):
+        with self.lock:
+            queue = self.data['queue']
+            return list(islice(queue.ordered(time.time(), offset), limit)), len(queue)
+
+    def get_counters(self):
+        with self.lock:
+            return dict(self.data['counters'])
+
+    def has_idle_counter(self):
+        with self.lock:
+            return 0 in self.data['counters'].values()
+
+    def get_ticket_status(self, queue_number):
+        with self.lock:
+            if queue_number in self.data['serving']:
+                return 'serving'
+            if queue_number in self.data['queue']:
+                return 'waiting'
+            if self.data['ledger'].was_served(queue_number):
+                return 'served'
+            return None
+
+    def get_ticket_counter(self, queue_number):
+        return self.data['serving'].get(queue_number)
+
+    def get_ticket_lane(self, queue_number):
+        with self.lock:
+            return self.data['queue'].ticket(queue_number)
+
+    def get_position(self, queue_number):
+        with self.lock:
+            return self.data['queue'].position(queue_number, time.time())
+
+    def get_minutes_per_customer(self):
+        return self.estimator.minutes_per_customer(len(self.data['counters']))
+
+    def get_totals(self):
+        with self.lock:
+            served = self.data['ledger'].served
+            return len(self.data['queue']) + len(self.data['serving']) + served, served
+
+    # Numbers come from 'ticket_seq', which only goes up within a session,
+    # so a number is never issued twice. Walk-ins are logged without their
+    # lane, as before lanes existed.
+    def add_ticket(self, lane=DEFAULT_LANE, slot=None):
+        check_lane(lane, slot)
+        with self.lock:
+            next_number = self.data['ticket_seq'] + 1
+            self._record('add', next_number, time.time(), *_lane_args(lane, slot))
+            return next_number
+
+    def _apply_add(self, number, joined_at, lane=DEFAULT_LANE, slot=None):
+        self.data['queue'].add(number, lane, slot)
+        self.data['ledger'].join(number, joined_at)
+        self.data['ticket_seq'] = max(self.data['ticket_seq'], number)
+
+    # Batches are a single event, so they apply atomically with one bump
+    def add_tickets(self, count, lane=DEFAULT_LANE, slot=None):
+        check_lane(lane, slot)
+        with self.lock:
+            first = self.data['ticket_seq'] + 1
+            self._record('add_batch', first, count, time.time(), *_lane_args(lane, slot))
+            return list(range(first, first + count))
+
+    def _apply_add_batch(self, first, count, joined_at, lane=DEFAULT_LANE, slot=None):
+        for number in range(first, first + count):
+            self._apply_add(number, joined_at, lane, slot)
+
+    # With count > 1 the counter calls tickets in turn (for skipping
+    # no-shows) and ends up serving the last one called; the ones passed
+    # over are recorded as skipped rather than served
+    def serve_next(self, counter=None, count=1):
+        with self.lock:
+            counters = self.data['counters']
+            if counter is None:
+                counter = next(iter(counters))
+            elif counter not in counters:
+                raise KeyError(counter)
+            queue = self.data['queue']
+            now = time.time()
+            if count == 1:
+                next_number = queue.first(now) or 0
+                self._record('serve', counter, next_number, now)
+                return next_number
+            numbers = list(islice(queue.ordered(now), count))
+            if len(numbers) < count:
+                numbers.append(0)
+            self._record('serve_batch', counter, numbers, now)
+            return numbers[-1]
+
+    def _apply_serve_batch(self, counter, numbers, served_at):
+        for index, next_number in enumerate(numbers):
+            self._apply_serve(counter, next_number, served_at, 'skipped' if index else 'served')
+
+    def _apply_serve(self, counter, next_number, served_at, finished='served'):
+        data = self.data
+        current_number = data['counters'][counter]
+        if current_number > 0:
+            del data['serving'][current_number]
+            data['ledger'].finish(current_number, finished, served_at)
+            if finished == 'served':
+                self.estimator.record(served_at)
+        if next_number:
+            data['queue'].remove(next_number)
+            data['serving'][next_number] = counter
+            data['ledger'].call(next_number, counter, served_at)
+        data['counters'][counter] = next_number
+
+    def remove_ticket(self, queue_number):
+        with self.lock:
+            if queue_number not in self.data['queue']:
+                return False
+            self._record('remove', queue_number, time.time())
+            return True
+
+    def _apply_remove(self, number, removed_at):
+        self.data['queue'].remove(number)
+        self.data['ledger'].finish(number, 'removed', removed_at)
+
+    def remove_tickets(self, numbers):
+        with self.lock:
+            queue = self.data['queue']
+            removed = sorted({number for number in numbers if number in queue})
+            if removed:
+                self._record('remove_batch', removed, time.time())
+            return removed
+
+    def _apply_remove_batch(self, numbers, removed_at):
+        for number in numbers:
+            self._apply_remove(number, removed_at)
+
+    # Rows in EXPORT_FIELDS order: finished tickets first, then live ones
+    def iter_tickets(self):
+        with self.lock:
+            return self.data['ledger'].reader()
+
+
+# Shared storage for several worker processes, on the queue.db schema.
+# Rows in `queue` are 'waiting', 'serving' (at `counter`), 'served',
+# 'skipped' or 'removed', in a `lane`; appointments also have a `slot` time. queue_status row 1 holds the session; `counters` holds the
+# service counters and the ticket each one is serving.
+class SQLiteStore(QueueStore):
+    SCHEMA = (
+        '''CREATE TABLE IF NOT EXISTS queue
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  name TEXT,
+                  phone TEXT,
+                  queue_number INTEGER,
+                  status TEXT DEFAULT 'waiting',
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''',
+        '''CREATE TABLE IF NOT EXISTS queue_status
+                 (id INTEGER PRIMARY KEY,
+                  is_active BOOLEAN DEFAULT FALSE,
+                  business_name TEXT DEFAULT 'Our Business',
+                  created_by TEXT DEFAULT 'Admin')''',
+        '''CREATE TABLE IF NOT EXISTS counters
+                 (name TEXT PRIMARY KEY,
+                  position INTEGER,
+                  serving_number INTEGER DEFAULT 0)''',
+        'INSERT OR IGNORE INTO queue_status (id) VALUES (1)',
+    )
+    # Columns added to the original queue.db tables when missing
+    COLUMNS = {
+        'queue': {
+            'served_at': 'REAL',
+            'counter': 'TEXT',
+            'joined_at': 'REAL',
+            'called_at': 'REAL',
+            'removed_at': 'REAL',
+            'lane': f"TEXT DEFAULT '{DEFAULT_LANE}'",
+            'slot': 'REAL',
+        },
+        'queue_status': {
+            'session_started': 'TIMESTAMP',
+            'version': 'INTEGER DEFAULT 0',
+            'ticket_count': 'INTEGER DEFAULT 0',
+            'served_count': 'INTEGER DEFAULT 0',
+            'epoch': 'TEXT',
+            'next_slot': 'REAL',
+            'ticket_seq': 'INTEGER DEFAULT 0',
+        },
+    }
+    # Run once when the matching column is added to an existing database
+    BACKFILLS = {
+        ('queue_status', 'ticket_count'):
+            "UPDATE queue_status SET ticket_count = "
+            "(SELECT COUNT(*) FROM queue WHERE status IN ('waiting', 'serving', 'served'))",
+        ('queue_status', 'served_count'):
+            "UPDATE queue_status SET served_count = (SELECT COUNT(*) FROM queue WHERE status = 'served')",
+        ('queue_status', 'ticket_seq'):
+            'UPDATE queue_status SET ticket_seq = (SELECT COALESCE(MAX(queue_number), 0) FROM queue)',
+    }
+    INDEXES = (
+        'CREATE INDEX IF NOT EXISTS idx_queue_status_number ON queue (status, queue_number)',
+        'CREATE INDEX IF NOT EXISTS idx_queue_served_at ON queue (served_at)',
+        'CREATE INDEX IF NOT EXISTS idx_queue_lane ON queue (status, lane, queue_number)',
+        'CREATE INDEX IF NOT EXISTS idx_queue_slot ON queue (status, slot, queue_number) WHERE slot IS NOT NULL',
+    )
+    # Runs of the call order (see LaneQueue): due appointments, each lane,
+    # then appointments still to come. Each is one indexed range.
+    SEGMENTS = (
+        ("status = 'waiting' AND slot IS NOT NULL AND slot <= :now", 'slot, queue_number'),
+        *((f"status = 'waiting' AND lane = '{lane}'", 'queue_number') for lane in LANES),
+        ("status = 'waiting' AND slot IS NOT NULL AND slot > :now", 'slot, queue_number'),
+    )
+
+    def __init__(self, path, timeout=5.0):
+        super().__init__()
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+        self._shared_epoch = None
+
+    # One connection per thread, reopened after a fork so that each
+    # gunicorn worker gets its own
+    def connection(self):
+        local = self._local
+        conn = getattr(local, 'conn', None)
+        if conn is None or local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout,
+                                   isolation_level=None, cached_statements=64)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(f'PRAGMA busy_timeout={int(self.timeout * 1000)}')
+            local.conn = conn
+            local.pid = os.getpid()
+            if not self._schema_ready:
+                self._ensure_schema(conn)
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _ensure_schema(self, conn):
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            with self.transaction(conn):
+                for statement in self.SCHEMA:
+                    conn.execute(statement)
+                for table, table_columns in self.COLUMNS.items():
+                    columns = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+                    for name, declaration in table_columns.items():
+                        if name not in columns:
+                            conn.execute(f'ALTER TABLE {table} ADD COLUMN {name} {declaration}')
+                            if (table, name) in self.BACKFILLS:
+                                conn.execute(self.BACKFILLS[table, name])
+                for statement in self.INDEXES:
+                    conn.execute(statement)
+                conn.execute('UPDATE queue_status SET epoch = ? WHERE id = 1 AND epoch IS NULL', (self._epoch,))
+            self._schema_ready = True
+
+    # BEGIN IMMEDIATE takes the write lock up front, so read-then-write
+    # sequences (like ticket allocation) are atomic across processes
+    def transaction(self, conn=None):
+        return _Transaction(conn or self.connection())
+
+    def _status_row(self, conn):
+        return conn.execute(
+            'SELECT is_active, business_name, created_by, session_started '
+            'FROM queue_status WHERE id = 1'
+        ).fetchone()
+
+    # Also notes the next appointment slot, when the call order changes by itself
+    def _bump(self, conn):
+        conn.execute(
+            'UPDATE queue_status SET version = version + 1, next_slot = '
+            "(SELECT MIN(slot) FROM queue WHERE status = 'waiting' AND slot > ?) WHERE id = 1",
+            (time.time(),)
+        )
+
+    # The first read after an appointment's slot bumps the version for it,
+    # so whatever is cached per version sees the new order
+    def get_version(self):
+        conn = self.connection()
+        version, next_slot = conn.execute('SELECT version, next_slot FROM queue_status WHERE id = 1').fetchone()
+        if next_slot is not None and next_slot <= time.time():
+            with self.transaction(conn):
+                version, next_slot = conn.execute(
+                    'SELECT version, next_slot FROM queue_status WHERE id = 1'
+                ).fetchone()
+                if next_slot is not None and next_slot <= time.time():
+                    self._bump(conn)
+                    version += 1
+        return version
+
+    # Shared by every worker on the same database file
+    def get_epoch(self):
+        if self._shared_epoch is None:
+            self._shared_epoch = self.connection().execute(
+                'SELECT epoch FROM queue_status WHERE id = 1'
+            ).fetchone()[0]
+        return self._shared_epoch
+
+    def is_active(self):
+        return bool(self._status_row(self.connection())[0])
+
+    def set_active(self, active, business_name, created_by, counters=None):
+        conn = self.connection()
+        with self.transaction(conn):
+            conn.execute(
+                'UPDATE queue_status SET is_active = ?, business_name = ?, created_by = ? WHERE id = 1',
+                (bool(active), business_name, created_by)
+            )
+            if active:
+                conn.execute('DELETE FROM queue')
+                conn.execute('DELETE FROM counters')
+                conn.executemany(
+                    'INSERT INTO counters (name, position) VALUES (?, ?)',
+                    [(name, position) for position, name in enumerate(normalize_counters(counters))]
+                )
+                conn.execute(
+                    'UPDATE queue_status SET session_started = ?, ticket_count = 0, served_count = 0, '
+                    'ticket_seq = 0 WHERE id = 1',
+                    (datetime.now().isoformat(sep=' '),)
+                )
+            self._bump(conn)
+
+    def get_business_info(self):
+        row = self._status_row(self.connection())
+        session_started = datetime.fromisoformat(row[3]) if row[3] else None
+        return row[1], row[2], session_started
+
+    def _counters(self, conn):
+        counters = dict(conn.execute('SELECT name, serving_number FROM counters ORDER BY position'))
+        return counters or {DEFAULT_COUNTER: 0}
+
+    def get_queue_data(self):
+        conn = self.connection()
+        with _Snapshot(conn):
+            counters = self._counters(conn)
+            waiting = self._waiting_in_order(conn, time.time())
+        return counters, waiting, len(waiting)
+
+    # Segment sizes are only counted to skip past them for an offset
+    def _waiting_in_order(self, conn, now, offset=0, limit=None):
+        numbers = []
+        for condition, order in self.SEGMENTS:
+            remaining = -1 if limit is None else limit - len(numbers)
+            if remaining == 0:
+                break
+            if offset:
+                size = conn.execute(f'SELECT COUNT(*) FROM queue WHERE {condition}', {'now': now}).fetchone()[0]
+                if offset >= size:
+                    offset -= size
+                    continue
+            numbers.extend(row[0] for row in conn.execute(
+                f'SELECT queue_number FROM queue WHERE {condition} ORDER BY {order} LIMIT :limit OFFSET :offset',
+                {'now': now, 'limit': remaining, 'offset': offset}
+            ))
+            offset = 0
+        return numbers
+
+    def _next_waiting(self, conn, now):
+        numbers = self._waiting_in_order(conn, now, limit=1)
+        return numbers[0] if numbers else 0
+
+    # The waiting total comes from the maintained counts rather than a
+    # COUNT(*) over the queue
+    def get_waiting_page(self, offset, limit):
+        conn = self.connection()
+        with _Snapshot(conn):
+            page = self._waiting_in_order(conn, time.time(), offset, limit)
+            total = conn.execute(
+                'SELECT ticket_count - served_count - '
+                '(SELECT COUNT(*) FROM counters WHERE serving_number > 0) FROM queue_status WHERE id = 1'
+            ).fetchone()[0]
+        return page, total
+
+    def get_counters(self):
+        return self._counters(self.connection())
+
+    def has_idle_counter(self):
+        return 0 in self.get_counters().values()
+
+    def get_ticket_status(self, queue_number):
+        statuses = {row[0] for row in self.connection().execute(
+            "SELECT status FROM queue WHERE queue_number = ? AND status IN ('waiting', 'serving', 'served')",
+            (queue_number,)
+        )}
+        for status in ('served', 'serving', 'waiting'):
+            if status in statuses:
+                return status
+        return None
+
+    def get_ticket_counter(self, queue_number):
+        row = self.connection().execute(
+            "SELECT counter FROM queue WHERE queue_number = ? AND status = 'serving'",
+            (queue_number,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def get_ticket_lane(self, queue_number):
+        row = self.connection().execute(
+            "SELECT lane, slot FROM queue WHERE queue_number = ? AND status = 'waiting'", (queue_number,)
+        ).fetchone()
+        return tuple(row) if row else (None, None)
+
+    # Same rules as LaneQueue.position
+    def get_position(self, queue_number):
+        conn = self.connection()
+        with _Snapshot(conn):
+            row = conn.execute(
+                "SELECT lane, slot FROM queue WHERE queue_number = ? AND status = 'waiting'", (queue_number,)
+            ).fetchone()
+            if row is None:
+                return 0
+            lane, slot = row
+            now = time.time()
+            if slot is not None:
+                ahead = conn.execute(
+                    "SELECT COUNT(*) FROM queue WHERE status = 'waiting' AND slot IS NOT NULL "
+                    "AND (slot < :slot OR (slot = :slot AND queue_number < :number))",
+                    {'slot': slot, 'number': queue_number}
+                ).fetchone()[0]
+                if slot > now:
+                    # Still to come: behind every lane
+                    ahead += conn.execute(
+                        f"SELECT COUNT(*) FROM queue WHERE status = 'waiting' "
+                        f"AND lane IN ({', '.join('?' * len(LANES))})", LANES
+                    ).fetchone()[0]
+                return ahead + 1
+            ahead = conn.execute(
+                "SELECT COUNT(*) FROM queue WHERE status = 'waiting' AND slot IS NOT NULL AND slot <= ?",
+                (now,)
+            ).fetchone()[0]
+            earlier = LANES[:LANES.index(lane)] if lane in LANES else LANES
+            if earlier:
+                ahead += conn.execute(
+                    f"SELECT COUNT(*) FROM queue WHERE status = 'waiting' "
+                    f"AND lane IN ({', '.join('?' * len(earlier))})", earlier
+                ).fetchone()[0]
+            ahead += conn.execute(
+                "SELECT COUNT(*) FROM queue WHERE status = 'waiting' AND lane = ? AND queue_number < ?",
+                (lane, queue_number)
+            ).fetchone()[0]
+        return ahead + 1
+
+    # Rebuilt from the last WINDOW serve times once per state version, so
+    # every worker sees the same estimate
+    def get_minutes_per_customer(self):
+        return self.cached('minutes_per_customer', self._estimate_minutes_per_customer)
+
+    def _estimate_minutes_per_customer(self):
+        conn = self.connection()
+        rows = conn.execute(
+            "SELECT served_at FROM queue WHERE served_at IS NOT NULL "
+            "ORDER BY served_at DESC LIMIT ?",
+            (WINDOW + 1,)
+        ).fetchall()
+        estimator = ServiceRateEstimator.from_timestamps(row[0] for row in reversed(rows))
+        return estimator.minutes_per_customer(len(self._counters(conn)))
+
+    # Maintained alongside each mutation instead of counted per request
+    def get_totals(self):
+        return self.connection().execute(
+            'SELECT ticket_count, served_count FROM queue_status WHERE id = 1'
+        ).fetchone()
+
+    # From queue_status.ticket_seq, which only goes up within a session, so a
+    # number is never issued twice. Returns the first of `count`.
+    def _issue_numbers(self, conn, count):
+        conn.execute('UPDATE queue_status SET ticket_seq = ticket_seq + ? WHERE id = 1', (count,))
+        return conn.execute('SELECT ticket_seq FROM queue_status WHERE id = 1').fetchone()[0] - count + 1
+
+    def add_ticket(self, lane=DEFAULT_LANE, slot=None):
+        check_lane(lane, slot)
+        conn = self.connection()
+        with self.transaction(conn):
+            next_number = self._issue_numbers(conn, 1)
+            conn.execute('INSERT INTO queue (queue_number, joined_at, lane, slot) VALUES (?, ?, ?, ?)',
+                         (next_number, time.time(), lane, slot))
+            conn.execute('UPDATE queue_status SET ticket_count = ticket_count + 1 WHERE id = 1')
+            self._bump(conn)
+        return next_number
+
+    def serve_next(self, counter=None, count=1):
+        conn = self.connection()
+        with self.transaction(conn):
+            if counter is None:
+                row = conn.execute(
+                    'SELECT name, serving_number FROM counters ORDER BY position LIMIT 1'
+                ).fetchone()
+            else:
+                row = conn.execute(
+                    'SELECT name, serving_number FROM counters WHERE name = ?', (counter,)
+                ).fetchone()
+            if row is None:
+                raise KeyError(counter)
+            counter, current_number = row
+            now = time.time()
+            for index in range(count):
+                if current_number and index:
+                    # Called and passed over in this batch: a no-show, which
+                    # leaves the totals like a removed ticket
+                    conn.execute(
+                        "UPDATE queue SET status = 'skipped', removed_at = ? WHERE status = 'serving' AND counter = ?",
+                        (now, counter)
+                    )
+                    conn.execute('UPDATE queue_status SET ticket_count = ticket_count - 1 WHERE id = 1')
+                elif current_number:
+                    conn.execute(
+                        "UPDATE queue SET status = 'served', served_at = ? WHERE status = 'serving' AND counter = ?",
+                        (now, counter)
+                    )
+                    conn.execute('UPDATE queue_status SET served_count = served_count + 1 WHERE id = 1')
+                current_number = self._next_waiting(conn, now)
+                if not current_number:
+                    break
+                conn.execute(
+                    "UPDATE queue SET status = 'serving', counter = ?, called_at = ? WHERE id = "
+                    "(SELECT MIN(id) FROM queue WHERE status = 'waiting' AND queue_number = ?)",
+                    (counter, now, current_number)
+                )
+            conn.execute('UPDATE counters SET serving_number = ? WHERE name = ?', (current_number, counter))
+            self._bump(conn)
+        return current_number
+
+    def remove_ticket(self, queue_number):
+        conn = self.connection()
+        with self.transaction(conn):
+            cursor = conn.execute(
+                "UPDATE queue SET status = 'removed', removed_at = ? WHERE queue_number = ? AND status = 'waiting'",
+                (time.time(), queue_number)
+            )
+            if cursor.rowcount:
+                conn.execute(
+                    'UPDATE queue_status SET ticket_count = ticket_count - ? WHERE id = 1',
+                    (cursor.rowcount,)
+                )
+                self._bump(conn)
+        return cursor.rowcount > 0
+
+    def add_tickets(self, count, lane=DEFAULT_LANE, slot=None):
+        check_lane(lane, slot)
+        conn = self.connection()
+        with self.transaction(conn):
+            first = self._issue_numbers(conn, count)
+            now = time.time()
+            conn.executemany('INSERT INTO queue (queue_number, joined_at, lane, slot) VALUES (?, ?, ?, ?)',
+                             [(number, now, lane, slot) for number in range(first, first + count)])
+            conn.execute('UPDATE queue_status SET ticket_count = ticket_count + ? WHERE id = 1', (count,))
+            self._bump(conn)
+        return list(range(first, first + count))
+
+    def remove_tickets(self, numbers):
+        numbers = sorted(set(numbers))
+        removed = []
+        conn = self.connection()
+        with self.transaction(conn):
+            now = time.time()
+            for start in range(0, len(numbers), 500):
+                chunk = numbers[start:start + 500]
+                placeholders = ', '.join('?' * len(chunk))
+                removed.extend(row[0] for row in conn.execute(
+                    f"SELECT queue_number FROM queue WHERE status = 'waiting' AND queue_number IN ({placeholders})",
+                    chunk
+                ))
+                conn.execute(
+                    f"UPDATE queue SET status = 'removed', removed_at = ? "
+                    f"WHERE status = 'waiting' AND queue_number IN ({placeholders})",
+                    [now, *chunk]
+                )
+            if removed:
+                conn.execute(
+                    'UPDATE queue_status SET ticket_count = ticket_count - ? WHERE id = 1', (len(removed),)
+                )
+                self._bump(conn)
+        return sorted(removed)
+
+    # Rows in EXPORT_FIELDS order, read in batches on a separate connection
+    # whose read snapshot stays fixed while the export streams
+    def iter_tickets(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        try:
+            cursor = conn.execute(
+                'SELECT queue_number, status, counter, joined_at, called_at, served_at, removed_at '
+                'FROM queue ORDER BY id'
+            )
+            while True:
+                batch = cursor.fetchmany(500)
+                if not batch:
+                    break
+                yield from batch
+        finally:
+            conn.close()
+
+
+class _Transaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
+
+
+# Read transaction, so multi-statement reads see one consistent snapshot
+class _Snapshot(_Transaction):
+    def __enter__(self):
+        self.conn.execute('BEGIN')
+        return self.conn
+
+
+# Other queues get their own database file next to the default one
+def queue_db_path(queue_id, db_path):
+    if queue_id == DEFAULT_QUEUE_ID:
+        return db_path
+    queue_dir = os.environ.get('QUEUE_DB_DIR') or os.path.join(os.path.dirname(db_path) or '.', 'queues')
+    return os.path.join(queue_dir, f'{queue_id}.db')
+
+
+def create_store(queue_id=DEFAULT_QUEUE_ID):
+    db_path = os.environ.get('QUEUE_DB')
+    if not db_path:
+        log_dir = os.environ.get('QUEUE_LOG_DIR')
+        return MemoryStore(EventLog(log_dir, queue_id) if log_dir else None)
+    db_path = queue_db_path(queue_id, db_path)
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+    return SQLiteStore(db_path)
+
+
+# Whether an earlier process left state for this queue to load
+def queue_exists(queue_id):
+    db_path = os.environ.get('QUEUE_DB')
+    if db_path:
+        return os.path.exists(queue_db_path(queue_id, db_path))
+    log_dir = os.environ.get('QUEUE_LOG_DIR')
+    return bool(log_dir) and any(
+        os.path.exists(os.path.join(log_dir, f'{queue_id}{suffix}')) for suffix in ('.log', '.snapshot')
+    )
+
+
+# Stores for every queue hosted by this process, created on first use and
+# dropped again once idle (least recently used first)
+class QueueRegistry:
+    def __init__(self, factory=create_store, exists=queue_exists, idle_seconds=QUEUE_IDLE_SECONDS,
+                 max_queues=MAX_QUEUES):
+        self.factory = factory
+        self.exists = exists
+        self.idle_seconds = idle_seconds
+        self.max_queues = max_queues
+        self._stores = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def __len__(self):
+        return len(self._stores)
+
+    def __contains__(self, queue_id):
+        return queue_id in self._stores
+
+    # Returns None for a queue that was never started unless `create` is
+    # set; the default queue always exists
+    def get(self, queue_id=DEFAULT_QUEUE_ID, create=False):
+        with self._lock:
+            store = self._stores.get(queue_id)
+            if store is None:
+                if not (create or queue_id == DEFAULT_QUEUE_ID or self.exists(queue_id)):
+                    return None
+                store = self._stores[queue_id] = self.factory(queue_id)
+            self._stores.move_to_end(queue_id)
+            store.last_used = time.monotonic()
+            self._evict_idle(store.last_used)
+        return store
+
+    def put(self, queue_id, store):
+        with self._lock:
+            previous = self._stores.pop(queue_id, None)
+            self._stores[queue_id] = store
+        if previous is not None and previous is not store:
+            previous.close()
+
+    def _evict_idle(self, now):
+        if len(self._stores) <= self.max_queues and now - self._last_sweep < min(self.idle_seconds, 60):
+            return
+        self._last_sweep = now
+        for queue_id, store in list(self._stores.items()):
+            over_limit = len(self._stores) > self.max_queues
+            if not over_limit and now - store.last_used < self.idle_seconds:
+                break
+            if queue_id != DEFAULT_QUEUE_ID and store.can_evict():
+                del self._stores[queue_id]
+                store.close()
@@ -0,0 +1,28 @@
+import pytest
+
+import main
+from ratelimit import TokenBucketLimiter
+from storage import QueueRegistry
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.delenv('QUEUE_DB', raising=False)
+    monkeypatch.delenv('QUEUE_LOG_DIR', raising=False)
+    monkeypatch.setattr(main, 'queues', QueueRegistry())
+    monkeypatch.setattr(main, 'join_limiter', TokenBucketLimiter(main.JOIN_RATE_PER_MINUTE / 60, main.JOIN_BURST))
+    main.qr_cache.clear()
+    app = main.create_app()
+    app.config['TESTING'] = True
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def started(client):
+    client.post('/admin/start', data={'business_name': 'Test', 'created_by': 'Tester', 'counters': 'A, B'})
+    return client
@@ -0,0 +1,33 @@
+import time
+
+from storage import LANES
+
+COUNTERS = ['A', 'B']
+
+
+# Applies the same random mutations to every store and checks they agree
+# on each return value. Appointments are an hour either side of now, so
+# none comes due while a test runs.
+def apply_random_ops(rnd, stores, steps):
+    now = time.time()
+    for _ in range(steps):
+        roll = rnd.random()
+        if roll < 0.6:
+            lane = rnd.choice((*LANES, 'appointment'))
+            slot = now + rnd.choice((-3600, 3600, 7200)) + rnd.randint(0, 5) if lane == 'appointment' else None
+            if rnd.random() < 0.2:
+                count = rnd.randint(2, 5)
+                results = [store.add_tickets(count, lane, slot) for store in stores]
+            else:
+                results = [store.add_ticket(lane, slot) for store in stores]
+        elif roll < 0.8:
+            counter, count = rnd.choice(COUNTERS), rnd.choice((1, 1, 3))
+            results = [store.serve_next(counter, count) for store in stores]
+        elif roll < 0.9:
+            waiting = list(stores[0].get_queue_data()[1])
+            numbers = rnd.sample(waiting, min(3, len(waiting)))
+            results = [store.remove_tickets(numbers) for store in stores]
+        else:
+            number = rnd.randint(1, 60)
+            results = [store.remove_ticket(number) for store in stores]
+        assert all(result == results[0] for result in results)
@@ -0,0 +1,50 @@
+import pytest
+
+import main
+
+
+def test_pages_past_the_end_share_the_last_page(started):
+    started.post('/admin/add', data={'count': 3})
+    for page in (1, 2, 50, 5000):
+        data = started.get(f'/admin/live?page={page}').get_json()
+        assert data['page'] == data['pages'] == 1
+        assert data['waiting'] == [1, 2, 3]
+    assert list(main.queues.get()._derived) == [('admin_snapshot', 1)]
+
+
+def test_cache_drops_entries_from_older_versions(started):
+    started.get('/admin/live')
+    started.get('/status/live')
+    assert len(main.queues.get()._derived) == 2
+    started.post('/admin/add', data={'count': 1})
+    started.get('/status/live')
+    assert list(main.queues.get()._derived) == ['status_snapshot']
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('2', [2]),
+    ('5, 2-4', [2, 3, 4, 5]),
+    ('3-4,4, ,', [3, 4]),
+    ('', []),
+])
+def test_bulk_remove_parses_numbers(started, value, expected):
+    started.post('/admin/add', data={'count': 6})
+    response = started.post('/admin/remove', data={'numbers': value}, headers={'Accept': 'application/json'})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['removed'] == expected
+    assert data['waiting'] == [number for number in range(1, 7) if number not in expected]
+
+
+@pytest.mark.parametrize('value', ['x', '0', '4-2', '3-', '-3', '1-2-3', '²', f'1-{main.ADMIN_BULK_LIMIT + 1}'])
+def test_bulk_remove_rejects_bad_input(started, value):
+    started.post('/admin/add', data={'count': 3})
+    assert started.post('/admin/remove', data={'numbers': value}).status_code == 400
+    assert main.queues.get().get_waiting_page(0, 0)[1] == 3
+
+
+def test_bulk_remove_redirects_plain_forms(started):
+    started.post('/admin/add', data={'count': 3})
+    response = started.post('/admin/remove?page=1', data={'numbers': '1-2'})
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/admin?page=1')
@@ -0,0 +1,55 @@
+import gzip
+
+import pytest
+
+import main
+
+GZIP = {'Accept-Encoding': 'gzip'}
+
+
+def test_pages_are_compressed(started):
+    started.post('/admin/add', data={'count': 30})
+    plain = started.get('/status')
+    compressed = started.get('/status', headers=GZIP)
+    assert 'Content-Encoding' not in plain.headers
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.vary
+    assert gzip.decompress(compressed.data) == plain.data
+    # One ETag for the state, whatever the encoding
+    assert compressed.headers['ETag'] == plain.headers['ETag']
+    assert compressed.get_etag()[1]
+
+
+def test_other_responses_are_compressed(started):
+    plain = started.get('/metrics')
+    compressed = started.get('/metrics', headers=GZIP)
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert len(compressed.data) < len(plain.data)
+    assert gzip.decompress(compressed.data).startswith(b'# HELP')
+
+
+def test_small_and_streamed_responses_are_not(started):
+    assert 'Content-Encoding' not in started.get('/current_status', headers=GZIP).headers
+    started.post('/admin/add', data={'count': 300})
+    assert 'Content-Encoding' not in started.get('/admin/export.csv', headers=GZIP).headers
+
+
+@pytest.mark.parametrize('path', ['/', '/status', '/status/1', '/admin'])
+def test_unchanged_pages_are_a_304(started, monkeypatch, path):
+    started.post('/admin/add', data={'count': 2})
+    response = started.get(path)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    # Answered before the view runs
+    def fail(*_args, **_kwargs):
+        raise AssertionError('rendered')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(main, 'render_template', fail)
+        cached = started.get(path, headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.data == b''
+
+    started.post('/admin/next', data={'counter': 'A'})
+    assert started.get(path, headers={'If-None-Match': etag}).status_code == 200
@@ -0,0 +1,83 @@
+import os
+import random
+
+import pytest
+from helpers import COUNTERS, apply_random_ops
+
+from eventlog import EventLog
+from storage import MemoryStore
+
+
+def state(store):
+    counters, waiting, total = store.get_queue_data()
+    return {
+        'version': store.get_version(),
+        'active': store.is_active(),
+        'queue': (counters, waiting, total),
+        'positions': [store.get_position(number) for number in waiting],
+        'lanes': [store.get_ticket_lane(number) for number in waiting],
+        'totals': store.get_totals(),
+        'tickets': list(store.iter_tickets()),
+        'minutes_per_customer': round(store.get_minutes_per_customer(), 6),
+    }
+
+
+def run_session(store, seed, steps=400):
+    rnd = random.Random(seed)
+    store.set_active(True, 'Business', 'Manager', COUNTERS)
+    for _ in range(steps // 50):
+        apply_random_ops(rnd, [store], 50)
+        if rnd.random() < 0.2:
+            store.set_active(True, 'Next', 'Manager', COUNTERS)
+
+
+def reopen(directory, **kwargs):
+    store = MemoryStore(EventLog(str(directory), 'queue', **kwargs))
+    return store, state(store)
+
+
+@pytest.mark.parametrize('snapshot_every', [10 ** 9, 37])
+@pytest.mark.parametrize('seed', range(3))
+def test_replay_matches_live_store(tmp_path, seed, snapshot_every):
+    store = MemoryStore(EventLog(str(tmp_path), 'queue', snapshot_every=snapshot_every))
+    run_session(store, seed)
+    expected = state(store)
+    store.close()
+    assert os.path.exists(tmp_path / 'queue.snapshot') == (snapshot_every < 10 ** 9)
+
+    recovered, recovered_state = reopen(tmp_path)
+    assert recovered_state == expected
+    recovered.add_ticket()
+    recovered.close()
+    assert reopen(tmp_path)[1]['version'] == expected['version'] + 1
+
+
+def test_torn_tail_is_dropped(tmp_path):
+    store = MemoryStore(EventLog(str(tmp_path), 'queue'))
+    run_session(store, 0, 100)
+    expected = state(store)
+    store.close()
+    with open(tmp_path / 'queue.log', 'a') as f:
+        f.write('["add",99999')
+    assert reopen(tmp_path)[1] == expected
+
+
+# A crash after the log was rotated but before the snapshot was written
+# leaves queue.log.old behind; both logs are replayed and folded together
+def test_interrupted_snapshot(tmp_path):
+    store = MemoryStore(EventLog(str(tmp_path), 'queue', snapshot_every=50))
+    run_session(store, 1, 200)
+    store.log._snapshotter.join()
+    store.log._write_snapshot = lambda _state, old, _before: old.close()
+    apply_random_ops(random.Random(2), [store], 60)
+    expected = state(store)
+    store.close()
+    assert os.path.exists(tmp_path / 'queue.log.old')
+
+    recovered, recovered_state = reopen(tmp_path, snapshot_every=50)
+    assert recovered_state == expected
+    assert not os.path.exists(tmp_path / 'queue.log.old')
+    apply_random_ops(random.Random(3), [recovered], 120)
+    expected = state(recovered)
+    recovered.close()
+    assert reopen(tmp_path)[1] == expected
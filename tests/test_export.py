@@ -0,0 +1,54 @@
+import csv
+import io
+import json
+
+import pytest
+
+import main
+from history import EXPORT_FIELDS
+
+
+@pytest.fixture
+def session(started, monkeypatch):
+    # Small batches, so the rows span several chunks
+    monkeypatch.setattr(main, 'EXPORT_BATCH', 2)
+    started.post('/admin/add', data={'count': 5})
+    started.post('/admin/next', data={'counter': 'A'})
+    started.post('/admin/next', data={'counter': 'A'})
+    started.post('/admin/remove/4')
+    return started
+
+
+EXPECTED = [('1', 'served', 'A'), ('2', 'serving', 'A'), ('3', 'waiting', ''), ('4', 'removed', ''),
+            ('5', 'waiting', '')]
+
+
+def test_csv_export(session):
+    response = session.get('/admin/export.csv')
+    assert response.mimetype == 'text/csv'
+    assert response.headers['Content-Disposition'].startswith('attachment; filename="queue-default-')
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows[0] == list(EXPORT_FIELDS)
+    assert sorted(tuple(row[:3]) for row in rows[1:]) == EXPECTED
+    served = next(row for row in rows[1:] if row[0] == '1')
+    assert all(served[EXPORT_FIELDS.index(field)] for field in ('joined_at', 'called_at', 'served_at'))
+
+
+def test_ndjson_export(session):
+    response = session.get('/admin/export.ndjson')
+    assert response.mimetype == 'application/x-ndjson'
+    records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert all(list(record) == list(EXPORT_FIELDS) for record in records)
+    assert sorted((str(r['queue_number']), r['status'], r['counter'] or '') for r in records) == EXPECTED
+    removed = next(record for record in records if record['queue_number'] == 4)
+    assert removed['removed_at'] and removed['served_at'] is None
+
+
+def test_export_after_the_session_ends(session):
+    session.post('/admin/end')
+    rows = list(csv.reader(io.StringIO(session.get('/admin/export.csv').get_data(as_text=True))))
+    assert len(rows) == 6
+
+
+def test_unknown_format(started):
+    assert started.get('/admin/export.xml').status_code == 404
@@ -0,0 +1,42 @@
+import random
+
+import pytest
+
+from history import TicketLedger
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = TicketLedger(str(tmp_path), batch_size=3, window=5)
+    yield ledger
+    ledger.close()
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_was_served_matches_the_file(ledger, seed):
+    rnd = random.Random(seed)
+    served = set()
+    for number in range(1, 201):
+        ledger.join(number, number)
+    # Served slightly out of order, as lanes and appointments do
+    numbers = sorted(range(1, 201), key=lambda number: number + rnd.randint(0, 20))
+    for number in numbers:
+        status = 'served' if rnd.random() < 0.7 else 'removed'
+        ledger.finish(number, status, number)
+        if status == 'served':
+            served.add(number)
+        assert len(ledger.recent) <= ledger.window
+        probe = rnd.randint(0, 210)
+        assert ledger.was_served(probe) == (probe in served)
+    assert [number for number in range(0, 210) if ledger.was_served(number)] == sorted(served)
+
+
+def test_truncate_falls_back_to_the_file(ledger):
+    for number in range(1, 21):
+        ledger.join(number, number)
+        ledger.finish(number, 'served', number)
+    ledger.flush()
+    ledger.truncate(10)
+    assert not ledger.recent
+    assert ledger.served == 10
+    assert [number for number in range(1, 21) if ledger.was_served(number)] == list(range(1, 11))
@@ -0,0 +1,65 @@
+import pytest
+
+import main
+from ratelimit import TokenBucketLimiter
+
+
+def waiting(client):
+    return client.get('/status/live').get_json()['total_waiting']
+
+
+def test_limiter_refills_at_its_rate():
+    limiter = TokenBucketLimiter(rate=0.5, burst=2)
+    assert limiter.acquire('a', now=0) == 0
+    assert limiter.acquire('a', now=0) == 0
+    assert limiter.acquire('a', now=0) == pytest.approx(2)
+    assert limiter.acquire('a', now=1) == pytest.approx(1)
+    assert limiter.acquire('a', now=2) == 0
+    assert limiter.acquire('b', now=2) == 0
+
+
+def test_limiter_forgets_the_oldest_clients():
+    limiter = TokenBucketLimiter(rate=1, burst=1, max_clients=3)
+    for key in 'abcd':
+        limiter.acquire(key, now=0)
+    assert len(limiter) == 3
+    # 'a' was dropped and starts with a full bucket again
+    assert limiter.acquire('a', now=0) == 0
+    assert limiter.acquire('d', now=0) > 0
+
+
+def test_session_gets_its_ticket_back(started):
+    first = started.get('/join')
+    second = started.get('/join')
+    assert '<div class="queue-number">#1</div>' in first.get_data(as_text=True)
+    assert '<div class="queue-number">#1</div>' in second.get_data(as_text=True)
+    assert waiting(started) == 1
+
+
+def test_finished_ticket_is_not_reused(started):
+    started.get('/join')
+    started.post('/admin/next', data={'counter': 'A'})
+    # Still being served: the session is sent to its ticket
+    assert started.get('/join').headers['Location'].endswith('/status/1')
+    started.post('/admin/next', data={'counter': 'A'})
+    assert '<div class="queue-number">#2</div>' in started.get('/join').get_data(as_text=True)
+
+
+def test_head_issues_nothing(started):
+    assert started.head('/join').status_code == 200
+    assert waiting(started) == 0
+
+
+def test_floods_are_limited(app, started, monkeypatch):
+    monkeypatch.setattr(main, 'join_limiter', TokenBucketLimiter(rate=0.01, burst=2))
+    for _ in range(2):
+        started.delete_cookie(app.config['SESSION_COOKIE_NAME'])
+        assert started.get('/join').status_code == 200
+    started.delete_cookie(app.config['SESSION_COOKIE_NAME'])
+    response = started.get('/join')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    assert waiting(started) == 2
+    # Other addresses have their own bucket
+    other = app.test_client()
+    assert other.get('/join', environ_base={'REMOTE_ADDR': '10.0.0.2'}).status_code == 200
@@ -0,0 +1,128 @@
+import math
+import random
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from helpers import COUNTERS, apply_random_ops
+
+import main
+from eventlog import EventLog
+from storage import LANES, MemoryStore, SQLiteStore
+from ticket_queue import LaneQueue
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    store = MemoryStore() if request.param == 'memory' else SQLiteStore(str(tmp_path / 'queue.db'))
+    store.set_active(True, 'Business', 'Manager', COUNTERS)
+    yield store
+    store.close()
+
+
+# The call order spelled out: due appointments by slot, each lane oldest
+# first, then appointments still to come
+def naive_order(tickets, now):
+    appointments = sorted((slot, number) for number, (lane, slot) in tickets.items() if slot is not None)
+    lanes = [sorted(number for number, (name, slot) in tickets.items() if name == lane and slot is None)
+             for lane in LANES]
+    return ([number for slot, number in appointments if slot <= now]
+            + [number for lane in lanes for number in lane]
+            + [number for slot, number in appointments if slot > now])
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_lane_queue_matches_naive_order(seed):
+    rnd = random.Random(seed)
+    queue, tickets = LaneQueue(LANES), {}
+    for _ in range(200):
+        number = rnd.randint(1, 80)
+        if rnd.random() < 0.65:
+            if rnd.random() < 0.3:
+                lane, slot = 'appointment', float(rnd.randint(0, 20))
+            else:
+                lane, slot = rnd.choice(LANES), None
+            assert queue.add(number, lane, slot) == (number not in tickets)
+            tickets.setdefault(number, (lane, slot))
+        else:
+            assert queue.remove(number) == (number in tickets)
+            tickets.pop(number, None)
+    for now in (-1.0, 5.0, 10.5, 20.0, math.inf):
+        expected = naive_order(tickets, now)
+        assert list(queue.ordered(now)) == expected
+        assert queue.first(now) == (expected[0] if expected else None)
+        for offset in (0, 1, 7, len(expected) - 1, len(expected) + 3):
+            assert list(queue.ordered(now, offset)) == expected[max(0, offset):]
+        for index, number in enumerate(expected):
+            assert queue.position(number, now) == index + 1
+        assert queue.position(999, now) == 0
+        due = [slot for lane, slot in tickets.values() if slot is not None and slot > now]
+        assert queue.next_slot(now) == (min(due) if due else None)
+    assert sorted(queue.tickets()) == sorted((number, *ticket) for number, ticket in tickets.items())
+    assert LaneQueue(LANES, queue.tickets()).tickets() == queue.tickets()
+
+
+def test_positions_follow_call_order(store):
+    apply_random_ops(random.Random(7), [store], 300)
+    waiting = store.get_queue_data()[1]
+    assert [store.get_position(number) for number in waiting] == list(range(1, len(waiting) + 1))
+
+
+# A served VIP or appointment can hold the highest number while the queue
+# is still busy; its number must not be issued again
+def test_numbers_are_never_reissued(store):
+    store.add_tickets(3)
+    assert store.add_ticket('vip') == 4
+    store.serve_next('A')
+    store.serve_next('A')
+    assert store.get_ticket_status(4) == 'served'
+    assert store.add_ticket() == 5
+    assert store.add_tickets(2, 'appointment', time.time() + 3600) == [6, 7]
+    store.set_active(True, 'Business', 'Manager', COUNTERS)
+    assert store.add_ticket() == 1
+
+
+def test_version_moves_when_an_appointment_comes_due(store):
+    store.add_tickets(2)
+    store.add_ticket('appointment', time.time() + 0.3)
+    version = store.get_version()
+    assert list(store.get_queue_data()[1]) == [1, 2, 3]
+    time.sleep(0.4)
+    assert store.get_version() == version + 1
+    assert list(store.get_queue_data()[1]) == [3, 1, 2]
+    assert store.get_position(3) == 1
+
+
+def test_ticket_counter_survives_recovery(tmp_path):
+    store = MemoryStore(EventLog(str(tmp_path), 'queue', snapshot_every=5))
+    store.set_active(True, 'Business', 'Manager', COUNTERS)
+    store.add_tickets(3)
+    store.add_ticket('vip')
+    for _ in range(6):
+        store.serve_next('A')
+    store.close()
+    store = MemoryStore(EventLog(str(tmp_path), 'queue'))
+    assert store.add_ticket() == 5
+    store.close()
+
+
+# The page and its payloads carry the slot itself, so the countdown keeps
+# going while the unchanged state is answered with 304s
+def test_scheduled_ticket_carries_its_slot(started):
+    slot = datetime.now() + timedelta(hours=2)
+    started.post('/admin/add', data={'lane': 'appointment', 'slot': f'{slot:%H:%M}'})
+    expected = main.queues.get().get_ticket_lane(1)[1]
+    assert expected > time.time()
+    response = started.get('/status/1')
+    assert f'data-slot="{expected}"' in response.get_data(as_text=True)
+    assert started.get('/status/1', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+    data = started.get('/current_status/1').get_json()
+    assert data['status'] == 'scheduled'
+    assert data['slot'] == expected
+    assert abs(data['wait_time'] - (expected - time.time()) / 60) <= 1
+
+
+def test_waiting_ticket_has_no_slot(started):
+    started.post('/admin/add', data={'count': 1})
+    assert 'data-slot' not in started.get('/status/1').get_data(as_text=True)
+    assert started.get('/current_status/1').get_json()['slot'] is None
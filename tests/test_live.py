@@ -0,0 +1,92 @@
+import json
+import threading
+import time
+
+import pytest
+
+import main
+from storage import MemoryStore
+
+LIVE_URLS = ['/status/live', '/current_status', '/current_status/1', '/admin/live']
+
+
+@pytest.mark.parametrize('url', LIVE_URLS)
+def test_unchanged_state_is_a_304(started, url):
+    started.post('/admin/add', data={'count': 1})
+    response = started.get(url)
+    assert response.status_code == 200
+    version = response.get_json()['version']
+    assert response.headers['ETag'] == f'W/"{version}"'
+    assert started.get(url, query_string={'version': version}).status_code == 304
+    assert started.get(url, headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+    started.post('/admin/add', data={'count': 1})
+    assert started.get(url, query_string={'version': version}).status_code == 200
+
+
+def test_version_changes_with_the_store(started):
+    version = started.get('/status/live').get_json()['version']
+    number = main.queues.get().get_version()
+    # A restarted worker may reach the same version number with other state
+    main.queues.put(main.DEFAULT_QUEUE_ID, MemoryStore())
+    started.post('/admin/start', data={'business_name': 'Test', 'created_by': 'Tester', 'counters': 'A, B'})
+    assert main.queues.get().get_version() == number
+    response = started.get('/status/live', query_string={'version': version})
+    assert response.status_code == 200
+    assert response.get_json()['version'] != version
+
+
+def test_bare_version_number_is_not_a_match(started):
+    version = main.queues.get().get_version()
+    assert started.get('/status/live', query_string={'version': version}).status_code == 200
+
+
+def test_admin_actions_return_the_new_version(started):
+    response = started.post('/admin/add', data={'count': 1}, headers={'Accept': 'application/json'})
+    version = response.get_json()['version']
+    assert started.get('/admin/live', query_string={'version': version}).status_code == 304
+
+
+@pytest.fixture
+def short_streams(monkeypatch):
+    monkeypatch.setattr(main, 'SSE_MAX_DURATION', 0.3)
+    monkeypatch.setattr(main, 'SSE_POLL_INTERVAL', 0.05)
+
+
+def stream_events(response):
+    return [json.loads(line[len('data: '):]) for line in response.get_data(as_text=True).splitlines()
+            if line.startswith('data: ')]
+
+
+@pytest.mark.usefixtures('short_streams')
+@pytest.mark.parametrize('url', ['/status/stream', '/status/1/stream', '/admin/stream'])
+def test_stream_sends_the_current_state(started, url):
+    started.post('/admin/add', data={'count': 1})
+    response = started.get(url)
+    assert response.mimetype == 'text/event-stream'
+    assert 'Content-Encoding' not in response.headers
+    events = stream_events(response)
+    assert len(events) == 1
+    assert events[0]['active']
+    assert events[0]['version'] == started.get('/status/live').get_json()['version']
+
+
+@pytest.mark.usefixtures('short_streams')
+def test_stream_resumes_from_the_last_event(started):
+    version = started.get('/status/live').get_json()['version']
+    assert stream_events(started.get('/status/stream', headers={'Last-Event-ID': version})) == []
+    assert stream_events(started.get('/status/stream', query_string={'version': version})) == []
+
+
+@pytest.mark.usefixtures('short_streams')
+def test_stream_sends_changes(app, started):
+    def join_later():
+        time.sleep(0.1)
+        with app.test_request_context('/'):
+            main.store.add_ticket()
+            main.notify_queue_changed()
+
+    thread = threading.Thread(target=join_later)
+    thread.start()
+    events = stream_events(started.get('/status/stream'))
+    thread.join()
+    assert [event['total_waiting'] for event in events] == [0, 1]
@@ -0,0 +1,49 @@
+import pytest
+
+import main
+from metrics import Registry
+
+
+def test_render_in_text_format():
+    registry = Registry()
+    counter = registry.counter('joins_total', 'Joins', ('source',))
+    histogram = registry.histogram('duration_seconds', 'Duration', buckets=(0.1, 1.0))
+    counter.inc(2, labels=('a"b',))
+    histogram.observe(0.5)
+    assert registry.render().splitlines() == [
+        '# HELP joins_total Joins',
+        '# TYPE joins_total counter',
+        'joins_total{source="a\\"b"} 2',
+        '# HELP duration_seconds Duration',
+        '# TYPE duration_seconds histogram',
+        'duration_seconds_bucket{le="0.1"} 0',
+        'duration_seconds_bucket{le="1.0"} 1',
+        'duration_seconds_bucket{le="+Inf"} 1',
+        'duration_seconds_sum 0.5',
+        'duration_seconds_count 1',
+    ]
+
+
+def test_wrong_labels_fail_at_the_call():
+    registry = Registry()
+    counter = registry.counter('joins_total', 'Joins', ('source',))
+    histogram = registry.histogram('duration_seconds', 'Duration', ('endpoint',))
+    with pytest.raises(ValueError):
+        counter.inc()
+    with pytest.raises(ValueError):
+        histogram.observe(1.0, ('a', 'b'))
+    assert registry.render()
+
+
+def get_queue_data_calls():
+    series = main.helper_duration._series.get(('get_queue_data',))
+    return sum(series[0]) if series else 0
+
+
+def test_queue_depth_gauge(started):
+    started.post('/admin/add', data={'count': 3})
+    calls = get_queue_data_calls()
+    text = started.get('/metrics').get_data(as_text=True)
+    assert 'quickqueue_queue_depth 3' in text.splitlines()
+    # Scrapes must not show up as get_queue_data calls
+    assert get_queue_data_calls() == calls
@@ -0,0 +1,47 @@
+import pytest
+
+import main
+
+
+def test_print_returns_pdf(started):
+    response = started.post('/admin/print', data={'count': 3})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/pdf'
+    assert response.headers['Content-Disposition'] == 'attachment; filename="tickets-1-3.pdf"'
+    assert response.data.startswith(b'%PDF-')
+    assert response.data.count(b'/Type /Page ') == 3
+
+
+def test_print_limit(started):
+    assert started.post('/admin/print', data={'count': 0}).status_code == 400
+    assert started.post('/admin/print', data={'count': main.PRINT_LIMIT + 1}).status_code == 400
+
+
+def test_printed_numbers_are_fresh(started):
+    started.post('/admin/add', data={'count': 3})
+    started.post('/admin/remove/2')
+    started.post('/admin/remove/3')
+    response = started.post('/admin/print', data={'count': 2})
+    assert response.headers['Content-Disposition'] == 'attachment; filename="tickets-4-5.pdf"'
+
+
+@pytest.mark.usefixtures('started')
+def test_cli_writes_pdf(app, tmp_path):
+    output = tmp_path / 'tickets.pdf'
+    result = app.test_cli_runner().invoke(args=['print-tickets', '2', '-o', str(output)])
+    assert result.exit_code == 0, result.output
+    assert 'Tickets #1-#2' in result.output
+    assert output.read_bytes().startswith(b'%PDF-')
+
+
+def test_cli_rejects_unknown_queue(app):
+    result = app.test_cli_runner().invoke(args=['print-tickets', '3', '--queue', 'nope'])
+    assert result.exit_code == 1
+    assert "queue 'nope' does not exist" in result.output
+    assert 'nope' not in main.queues
+
+
+def test_cli_requires_active_session(app):
+    result = app.test_cli_runner().invoke(args=['print-tickets', '3'])
+    assert result.exit_code == 1
+    assert 'no active session' in result.output
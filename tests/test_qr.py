@@ -0,0 +1,40 @@
+import main
+
+
+def test_qr_is_cacheable(started):
+    response = started.get('/qr/join.png')
+    assert response.status_code == 200
+    assert response.mimetype == 'image/png'
+    assert response.data.startswith(b'\x89PNG')
+    etag, weak = response.get_etag()
+    assert etag and not weak
+    assert response.cache_control.public
+    assert response.cache_control.max_age == main.QR_MAX_AGE
+
+    cached = started.get('/qr/join.png', headers={'If-None-Match': response.headers['ETag']})
+    assert cached.status_code == 304
+    assert cached.data == b''
+
+
+def test_qr_is_rendered_once(started):
+    misses = main.get_qr_cache_stats()['misses']
+    first = started.get('/qr/status/7.png')
+    second = started.get('/qr/status/7.png')
+    assert first.data == second.data
+    assert main.get_qr_cache_stats()['misses'] == misses + 1
+
+
+def test_each_target_has_its_own_code(started):
+    etags = {started.get(path).get_etag()[0] for path in ('/qr/join.png', '/qr/status.png', '/qr/status/1.png')}
+    assert len(etags) == 3
+
+
+def test_cache_is_bounded(started, monkeypatch):
+    monkeypatch.setattr(main, 'QR_CACHE_SIZE', 2)
+    for number in range(1, 5):
+        started.get(f'/qr/status/{number}.png')
+    assert main.get_qr_cache_stats()['size'] == 2
+
+
+def test_unknown_kind(client):
+    assert client.get('/qr/other.png').status_code == 404
@@ -0,0 +1,51 @@
+import random
+
+import pytest
+from helpers import COUNTERS, apply_random_ops
+
+from storage import MemoryStore, SQLiteStore
+
+
+@pytest.fixture
+def stores(tmp_path):
+    memory, sqlite = MemoryStore(), SQLiteStore(str(tmp_path / 'queue.db'))
+    for store in (memory, sqlite):
+        store.set_active(True, 'Business', 'Manager', COUNTERS)
+    yield memory, sqlite
+    memory.close()
+
+
+# Number, status and counter; MemoryStore exports finished tickets first
+def ticket_rows(store):
+    return sorted(tuple(row[:3]) for row in store.iter_tickets())
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_memory_and_sqlite_agree(stores, seed):
+    memory, sqlite = stores
+    rnd = random.Random(seed)
+    for _ in range(20):
+        apply_random_ops(rnd, stores, 25)
+        counters, waiting, total = memory.get_queue_data()
+        assert sqlite.get_queue_data() == (counters, list(waiting), total)
+        for number in [*waiting, 0, 999]:
+            assert memory.get_position(number) == sqlite.get_position(number)
+            assert memory.get_ticket_lane(number) == sqlite.get_ticket_lane(number)
+            assert memory.get_ticket_status(number) == sqlite.get_ticket_status(number)
+        for offset, limit in ((0, 5), (3, 7), (max(0, total - 2), 10)):
+            assert memory.get_waiting_page(offset, limit) == sqlite.get_waiting_page(offset, limit)
+        assert memory.get_totals() == tuple(sqlite.get_totals())
+        assert ticket_rows(memory) == ticket_rows(sqlite)
+
+
+def test_bulk_skip_is_not_served(stores):
+    for store in stores:
+        store.add_tickets(10)
+        store.serve_next('A')
+        assert store.serve_next('A', 4) == 5
+        store.serve_next('A')
+        assert tuple(store.get_totals()) == (7, 2)
+        assert store.get_ticket_status(1) == 'served'
+        assert store.get_ticket_status(3) is None
+        assert [status for number, status, counter in ticket_rows(store)[:6]] == [
+            'served', 'skipped', 'skipped', 'skipped', 'served', 'serving']
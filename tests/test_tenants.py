@@ -0,0 +1,44 @@
+import pytest
+
+import main
+
+START = {'business_name': 'Shop', 'created_by': 'Owner', 'counters': 'Till'}
+
+
+@pytest.mark.parametrize('path', ['/q/shop/', '/q/shop/join', '/q/shop/status', '/q/shop/status/1',
+                                  '/q/shop/status/live', '/q/bad.id/status', f'/q/{"x" * 65}/'])
+def test_unknown_queue_is_a_404(client, path):
+    assert client.get(path).status_code == 404
+    assert 'shop' not in main.queues
+
+
+def test_admin_pages_do_not_create_the_queue(client):
+    assert client.get('/q/shop/admin/init').status_code == 200
+    assert client.get('/q/shop/admin').headers['Location'].endswith('/q/shop/admin/init')
+    assert 'shop' not in main.queues
+    assert client.get('/q/shop/join').status_code == 404
+
+
+def test_starting_creates_the_queue(client):
+    response = client.post('/q/shop/admin/start', data=START)
+    assert response.headers['Location'].endswith('/q/shop/admin')
+    assert 'shop' in main.queues
+    join = client.get('/q/shop/join')
+    assert join.status_code == 200
+    assert '/q/shop/status/1' in join.get_data(as_text=True)
+    assert client.get('/q/shop/status/1').status_code == 200
+
+
+def test_queues_are_separate(started):
+    started.post('/q/shop/admin/start', data=START)
+    started.post('/admin/add', data={'count': 3})
+    started.post('/q/shop/admin/add', data={'count': 1})
+    assert started.get('/status/live').get_json()['total_waiting'] == 3
+    shop = started.get('/q/shop/status/live').get_json()
+    assert shop['total_waiting'] == 1
+    assert shop['waiting'] == [1]
+    assert started.get('/q/shop/status/live').headers['ETag'] != started.get('/status/live').headers['ETag']
+    # The session keeps one ticket per queue
+    assert '<div class="queue-number">#4</div>' in started.get('/join').get_data(as_text=True)
+    assert '<div class="queue-number">#2</div>' in started.get('/q/shop/join').get_data(as_text=True)
+    assert '<div class="queue-number">#4</div>' in started.get('/join').get_data(as_text=True)
@@ -0,0 +1,45 @@
+import random
+
+import pytest
+
+from ticket_queue import TicketQueue
+
+
+def check_ticket_queue(queue, model):
+    model = sorted(model)
+    assert len(queue) == len(model)
+    assert bool(queue) == bool(model)
+    assert list(queue) == model
+    assert queue.first() == (model[0] if model else None)
+    assert queue.last() == (model[-1] if model else None)
+    assert queue.next_number() == (model[-1] + 1 if model else 1)
+    for k in range(len(model) + 2):
+        assert queue.kth(k) == (model[k - 1] if 1 <= k <= len(model) else None)
+    for number in range(0, (model[-1] if model else 0) + 3):
+        assert (number in queue) == (number in model)
+        assert queue.count_below(number) == sum(member < number for member in model)
+        assert list(queue.iter_from(number)) == [member for member in model if member >= number]
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('spread', [40, 2000])
+def test_ticket_queue_matches_sorted_list(seed, spread):
+    rnd = random.Random(seed)
+    queue, model = TicketQueue(), set()
+    for _ in range(300):
+        number = rnd.randint(1, spread)
+        if rnd.random() < 0.6:
+            assert queue.add(number) == (number not in model)
+            model.add(number)
+        else:
+            assert queue.remove(number) == (number in model)
+            model.discard(number)
+    check_ticket_queue(queue, model)
+
+
+def test_ticket_queue_bulk_load():
+    numbers = [5, 3, 90, 4, 17]
+    check_ticket_queue(TicketQueue(numbers), numbers)
+    queue = TicketQueue(numbers)
+    queue.clear()
+    check_ticket_queue(queue, [])
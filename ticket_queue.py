@@ -0,0 +1,253 @@
+# Indexed set of waiting ticket numbers.
+#
+# Membership is a set lookup, and a Fenwick tree over ticket numbers
+# answers "how many tickets are ahead of n" and "which is the k-th
+# ticket" in O(log n), so position, next-to-serve and removal never
+# scan the whole queue.
+
+import bisect
+import math
+
+
+class TicketQueue:
+    def __init__(self, numbers=()):
+        self._capacity = 64
+        self._tree = [0] * (self._capacity + 1)
+        self._members = set()
+        numbers = set(numbers)
+        if numbers:
+            if min(numbers) < 1:
+                raise ValueError("ticket numbers start at 1")
+            # Bulk load: one linear build instead of an update per ticket
+            self._members = numbers
+            self._grow(max(numbers))
+
+    def __len__(self):
+        return len(self._members)
+
+    def __bool__(self):
+        return bool(self._members)
+
+    def __contains__(self, number):
+        return number in self._members
+
+    def __iter__(self):
+        return self.iter_from(1)
+
+    def __repr__(self):
+        return f"TicketQueue({list(self)!r})"
+
+    def _grow(self, number):
+        capacity = self._capacity
+        while capacity < number:
+            capacity *= 2
+        tree = [0] * (capacity + 1)
+        for member in self._members:
+            tree[member] = 1
+        for i in range(1, capacity + 1):
+            parent = i + (i & -i)
+            if parent <= capacity:
+                tree[parent] += tree[i]
+        self._capacity = capacity
+        self._tree = tree
+
+    def _update(self, index, delta):
+        tree = self._tree
+        while index <= self._capacity:
+            tree[index] += delta
+            index += index & -index
+
+    def _prefix(self, index):
+        index = min(index, self._capacity)
+        total = 0
+        tree = self._tree
+        while index > 0:
+            total += tree[index]
+            index -= index & -index
+        return total
+
+    def add(self, number):
+        if number < 1:
+            raise ValueError("ticket numbers start at 1")
+        if number in self._members:
+            return False
+        if number > self._capacity:
+            self._grow(number)
+        self._members.add(number)
+        self._update(number, 1)
+        return True
+
+    def remove(self, number):
+        if number not in self._members:
+            return False
+        self._members.discard(number)
+        self._update(number, -1)
+        return True
+
+    def clear(self):
+        self.__init__()
+
+    def count_below(self, number):
+        if number <= 1:
+            return 0
+        return self._prefix(number - 1)
+
+    def kth(self, k):
+        # 1-based: kth(1) is the smallest ticket
+        if k < 1 or k > len(self._members):
+            return None
+        position = 0
+        step = self._capacity
+        tree = self._tree
+        while step:
+            candidate = position + step
+            if candidate <= self._capacity and tree[candidate] < k:
+                position = candidate
+                k -= tree[candidate]
+            step //= 2
+        return position + 1
+
+    def first(self):
+        return self.kth(1)
+
+    def last(self):
+        return self.kth(len(self._members))
+
+    def next_number(self):
+        last = self.last()
+        return last + 1 if last is not None else 1
+
+    def iter_from(self, number):
+        rank = self.count_below(number) + 1
+        start = self.kth(rank)
+        if start is None:
+            return
+        last = self.last()
+        members = self._members
+        # Walk the number range when it is mostly members; a sparse set (a
+        # lane holding a few scattered numbers) steps through ranks instead
+        if (len(members) - rank + 1) * 8 >= last - start + 1:
+            for candidate in range(start, last + 1):
+                if candidate in members:
+                    yield candidate
+        else:
+            for k in range(rank, len(members) + 1):
+                yield self.kth(k)
+
+
+# Waiting tickets split into service lanes. Walk-in lanes are called in the
+# order given, oldest ticket first, each indexed by its own TicketQueue.
+# Appointments (tickets with a slot time) are kept sorted by slot and go
+# ahead of every lane once their slot has come, so call order depends on
+# `now`. Next-to-call and positions cost O(lanes + log n).
+class LaneQueue:
+    def __init__(self, lanes, tickets=()):
+        grouped = {lane: [] for lane in lanes}
+        appointments = []
+        self._lane = {}
+        self._slot = {}
+        for number, lane, slot in tickets:
+            if slot is None:
+                grouped[lane].append(number)
+            else:
+                appointments.append((slot, number))
+                self._slot[number] = slot
+            self._lane[number] = lane
+        self.lanes = {lane: TicketQueue(numbers) for lane, numbers in grouped.items()}
+        self.appointments = sorted(appointments)
+        self._all = TicketQueue(self._lane)
+
+    def __len__(self):
+        return len(self._lane)
+
+    def __bool__(self):
+        return bool(self._lane)
+
+    def __contains__(self, number):
+        return number in self._lane
+
+    # Ticket numbers in ascending order, whatever their lane
+    def __iter__(self):
+        return iter(self._all)
+
+    def add(self, number, lane, slot=None):
+        if number in self._lane:
+            return False
+        if slot is None:
+            self.lanes[lane].add(number)
+        else:
+            bisect.insort(self.appointments, (slot, number))
+            self._slot[number] = slot
+        self._lane[number] = lane
+        self._all.add(number)
+        return True
+
+    def remove(self, number):
+        lane = self._lane.pop(number, None)
+        if lane is None:
+            return False
+        slot = self._slot.pop(number, None)
+        if slot is None:
+            self.lanes[lane].remove(number)
+        else:
+            del self.appointments[bisect.bisect_left(self.appointments, (slot, number))]
+        self._all.remove(number)
+        return True
+
+    # (lane, slot) of a waiting ticket, (None, None) otherwise
+    def ticket(self, number):
+        return self._lane.get(number), self._slot.get(number)
+
+    def tickets(self):
+        return [(number, self._lane[number], self._slot.get(number)) for number in self._all]
+
+    def _due(self, now):
+        return bisect.bisect_right(self.appointments, (now, math.inf))
+
+    # The earliest appointment slot after `now`, when the call order will
+    # next change by itself; None without appointments to come
+    def next_slot(self, now):
+        due = self._due(now)
+        return self.appointments[due][0] if due < len(self.appointments) else None
+
+    # (size, iterate from offset) for each run of the call order: due
+    # appointments, each lane, then appointments still to come
+    def _segments(self, now):
+        appointments = self.appointments
+        due = self._due(now)
+        segments = [(due, lambda start: (appointments[i][1] for i in range(start, due)))]
+        for queue in self.lanes.values():
+            segments.append((len(queue), lambda start, queue=queue: queue.iter_from(queue.kth(start + 1))))
+        segments.append((len(appointments) - due,
+                         lambda start: (appointments[i][1] for i in range(due + start, len(appointments)))))
+        return segments
+
+    # Waiting tickets in the order they will be called, from `offset` on
+    def ordered(self, now, offset=0):
+        for size, iterate in self._segments(now):
+            if offset >= size:
+                offset -= size
+                continue
+            yield from iterate(offset)
+            offset = 0
+
+    def first(self, now):
+        return next(self.ordered(now), None)
+
+    # 1-based place in ordered(now), 0 when not waiting
+    def position(self, number, now):
+        lane = self._lane.get(number)
+        if lane is None:
+            return 0
+        slot = self._slot.get(number)
+        if slot is not None:
+            ahead = bisect.bisect_left(self.appointments, (slot, number))
+            if slot > now:
+                # Still to come: behind every lane
+                ahead += len(self._lane) - len(self.appointments)
+            return ahead + 1
+        ahead = self._due(now)
+        for name, queue in self.lanes.items():
+            if name == lane:
+                return ahead + queue.count_below(number) + 1
+            ahead += len(queue)